@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+"""Compare the process and thread pool executors of package validation.
+
+Writes a number of random "packages" and a matching repodata into a temporary
+directory and times `_validate_packages` with each executor.
+"""
+import argparse
+import hashlib
+import os
+import tempfile
+import time
+
+from conda_mirror import conda_mirror
+
+
+def make_packages(directory, num_packages, package_size, num_entries):
+    """Write `num_packages` random packages of `package_size` bytes into
+    `directory` and return a repodata with `num_entries` packages that covers
+    them."""
+    repodata = {}
+    for i in range(num_packages):
+        filename = "pkg%d-1.0-0.tar.bz2" % i
+        content = os.urandom(package_size)
+        with open(os.path.join(directory, filename), "wb") as f:
+            f.write(content)
+        repodata[filename] = {
+            "name": "pkg%d" % i,
+            "md5": hashlib.md5(content).hexdigest(),
+            "size": package_size,
+        }
+    # packages which are not mirrored still add to the size of the repodata
+    for i in range(num_packages, num_entries):
+        repodata["pkg%d-1.0-0.tar.bz2" % i] = {
+            "name": "pkg%d" % i,
+            "depends": ["python >=3.8,<3.9.0a0", "numpy >=1.20"],
+            "md5": "0" * 32,
+            "sha256": "0" * 64,
+            "size": package_size,
+        }
+    return repodata
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__)
+    ap.add_argument("--num-packages", type=int, default=64)
+    ap.add_argument("--package-size", type=int, default=8 * 1024 * 1024)
+    ap.add_argument(
+        "--num-entries",
+        type=int,
+        default=100000,
+        help="Number of packages in the repodata",
+    )
+    ap.add_argument("--num-threads", type=int, default=0)
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+
+    conda_mirror._init_logger(0)
+
+    with tempfile.TemporaryDirectory() as directory:
+        repodata = make_packages(
+            directory,
+            args.num_packages,
+            args.package_size,
+            max(args.num_entries, args.num_packages),
+        )
+        for executor in conda_mirror.VALIDATION_EXECUTORS:
+            timings = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                results = conda_mirror._validate_packages(
+                    repodata,
+                    directory,
+                    num_threads=args.num_threads,
+                    executor=executor,
+                )
+                timings.append(time.perf_counter() - start)
+                assert all(reason is None for _, reason in results)
+            print(
+                "%-8s best %.3fs of %d runs (%d packages of %d bytes, "
+                "%d repodata entries)"
+                % (
+                    executor,
+                    min(timings),
+                    args.repeat,
+                    args.num_packages,
+                    args.package_size,
+                    len(repodata),
+                )
+            )
+
+
+if __name__ == "__main__":
+    main()
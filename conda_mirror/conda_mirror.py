@@ -1,5 +1,10 @@
 import argparse
+import asyncio
+import bisect
 import bz2
+import codecs
+import contextlib
+import copy
 import fnmatch
 import hashlib
 import json
@@ -9,23 +14,54 @@ import os
 import pdb
 import re
 import shutil
+import sqlite3
+import ssl
 import sys
 import tarfile
 import tempfile
+import threading
 import time
 import random
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from multiprocessing.pool import ThreadPool
 from pprint import pformat
-from typing import Any, Callable, Dict, Iterable, Set, Union, List, NamedTuple
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Set,
+    Union,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+)
 
 import requests
 import yaml
+from requests.adapters import HTTPAdapter
 
 from tqdm import tqdm
 
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
 try:
     from conda.models.version import BuildNumberMatch, VersionSpec, VersionOrder
+
+    version_cache_stats = None
 except ImportError:
     from .versionspec import BuildNumberMatch, VersionSpec, VersionOrder
+    from .versionspec import cache_stats as version_cache_stats
 
 logger = None
 
@@ -35,9 +71,35 @@ DEFAULT_PLATFORMS = ["linux-64", "linux-32", "osx-64", "win-64", "win-32", "noar
 
 DEFAULT_CHUNK_SIZE = 16 * 1024
 
+VALIDATION_BUFFER_SIZE = 1024 * 1024
+
+VALIDATION_EXECUTORS = ("process", "thread")
+
+HASH_POLICIES = ("md5", "sha256", "prefer-sha256", "all")
+
+DEFAULT_HASH_POLICY = "prefer-sha256"
+
+DOWNLOAD_BACKENDS = ("requests", "asyncio")
+
+VALIDATION_CACHE_FILENAME = "validation-cache.sqlite"
+# Number of validated packages written to the validation cache at once.
+VALIDATION_CACHE_BATCH_SIZE = 100
+
+# Arguments of `main` which can be given per channel to `mirror_channels`.
+CHANNEL_OPTIONS = (
+    "target_directory",
+    "platform",
+    "blacklist",
+    "whitelist",
+    "include_depends",
+)
+
 # Pattern matching special characters in version/build string matchers.
 VERSION_SPEC_CHARS = re.compile(r"[<>=^$!]")
 
+# Pattern matching the wildcards of glob expressions.
+GLOB_CHARS = re.compile(r"[*?[]")
+
 
 def _maybe_split_channel(channel):
     """Split channel if it is fully qualified.
@@ -99,8 +161,33 @@ def _match(all_packages: Dict[str, Dict[str, Any]], key_pattern_dict: Dict[str,
 
     """
 
-    matched = dict()
-    matchers: Dict[str, Callable[[Any], bool]] = {}
+    matcher = _rule_matcher(key_pattern_dict)
+    return {
+        pkg_name: pkg_info
+        for pkg_name, pkg_info in all_packages.items()
+        if matcher(pkg_info)
+    }
+
+
+def _rule_matcher(key_pattern_dict: Dict[str, str]) -> Callable[[Dict[str, Any]], bool]:
+    """Returns a function that tells whether a package metadata dict matches all
+    (key, pattern) pairs of a blacklist or whitelist entry, see `_match`."""
+    matchers = _key_matchers(key_pattern_dict)
+
+    def _rulematch(pkg_info):
+        # normalize the strings so that comparisons are easier
+        return all(
+            matcher(str(pkg_info.get(key, "")).lower())
+            for key, matcher in matchers.items()
+        )
+
+    return _rulematch
+
+
+def _key_matchers(key_pattern_dict: Dict[str, str]) -> Dict[str, Callable[[str], bool]]:
+    """Returns the functions matching the lowercased values of each key of a
+    blacklist or whitelist entry against its patterns."""
+    matchers: Dict[str, Callable[[str], bool]] = {}
     for key, pattern in sorted(key_pattern_dict.items()):
         key = key.lower()
         pattern = pattern.lower()
@@ -118,23 +205,190 @@ def _match(all_packages: Dict[str, Dict[str, Any]], key_pattern_dict: Dict[str,
         else:
             matcher = _glob_matcher(pattern)
         matchers[key] = matcher
+    return matchers
 
-    for pkg_name, pkg_info in all_packages.items():
-        # normalize the strings so that comparisons are easier
-        if all(
-            matcher(str(pkg_info.get(key, "")).lower())
-            for key, matcher in matchers.items()
-        ):
-            matched.update({pkg_name: pkg_info})
 
+def _compile_rules(
+    rules: List[Dict[str, str]],
+) -> Tuple[Set[str], Callable[[Dict[str, str]], bool]]:
+    """Compiles blacklist or whitelist entries into a single function telling
+    whether any of them matches a package.
+
+    Entries with a single glob pattern are grouped by key: patterns without
+    wildcards are looked up in a set and the others are combined into one
+    regular expression. The remaining entries are matched one by one.
+
+    Returns
+    -------
+    keys : set
+        The keys of the package metadata dicts the entries look at.
+    match : callable
+        Function taking a dict mapping each of `keys` to the lowercased string
+        value of a package and returning whether any entry matches it.
+    """
+    exact: Dict[str, Set[str]] = {}
+    globs: Dict[str, List[str]] = {}
+    others: List[Dict[str, Callable[[str], bool]]] = []
+    for rule in rules or ():
+        if len(rule) == 1:
+            ((key, pattern),) = rule.items()
+            key = key.lower()
+            pattern = pattern.lower()
+            if not (key in ("version", "build") and VERSION_SPEC_CHARS.search(pattern)):
+                if GLOB_CHARS.search(pattern):
+                    globs.setdefault(key, []).append(fnmatch.translate(pattern))
+                else:
+                    exact.setdefault(key, set()).add(pattern)
+                continue
+        others.append(_key_matchers(rule))
+    combined = [
+        (key, re.compile("|".join(patterns)).match) for key, patterns in globs.items()
+    ]
+    exact_items = list(exact.items())
+    keys = set(exact).union(globs, *others)
+
+    def _matchany(values):
+        return (
+            any(values[key] in patterns for key, patterns in exact_items)
+            or any(match(values[key]) for key, match in combined)
+            or any(
+                all(matcher(values[key]) for key, matcher in matchers.items())
+                for matchers in others
+            )
+        )
+
+    return keys, _matchany
+
+
+def _package_values(pkg_info: Dict[str, Any], keys: Iterable[str]) -> Dict[str, str]:
+    """The lowercased string values of `keys` in a package metadata dict."""
+    return {key: str(pkg_info.get(key, "")).lower() for key in keys}
+
+
+def _excluded_matcher(
+    blacklist: List[Dict[str, str]], whitelist: List[Dict[str, str]]
+) -> Callable[[Dict[str, Any]], bool]:
+    """Returns a function that tells whether a package metadata dict is
+    blacklisted and not whitelisted. Dependencies of whitelisted packages are
+    not taken into account."""
+    black_keys, blacklisted = _compile_rules(blacklist)
+    white_keys, whitelisted = _compile_rules(whitelist)
+    keys = black_keys | white_keys
+
+    def _excluded(pkg_info):
+        values = _package_values(pkg_info, keys)
+        return blacklisted(values) and not whitelisted(values)
+
+    return _excluded
+
+
+class _NameIndex:
+    """The package filenames of a repodata by lowercased package name, which
+    resolves the name pattern of a blacklist or whitelist entry without
+    looking at every package.
+    """
+
+    def __init__(self, all_packages: Dict[str, Dict[str, Any]]):
+        self.filenames: Dict[str, List[str]] = {}
+        for pkg_name, pkg_info in all_packages.items():
+            name = str(pkg_info.get("name", "")).lower()
+            self.filenames.setdefault(name, []).append(pkg_name)
+        self.names = sorted(self.filenames)
+
+    def match(self, pattern: str) -> List[str]:
+        """The filenames of the packages whose name matches a lowercased glob
+        expression. Names and name prefixes are looked up, and other globs are
+        matched against each distinct name."""
+        if not GLOB_CHARS.search(pattern):
+            return self.filenames.get(pattern, [])
+        prefix = pattern[:-1]
+        names = self.names
+        if pattern[-1] == "*" and not GLOB_CHARS.search(prefix):
+            matched = []
+            i = bisect.bisect_left(names, prefix)
+            while i < len(names) and names[i].startswith(prefix):
+                matched.append(names[i])
+                i += 1
+        else:
+            glob = re.compile(fnmatch.translate(pattern)).match
+            matched = [name for name in names if glob(name)]
+        return [pkg_name for name in matched for pkg_name in self.filenames[name]]
+
+
+def _match_rules(
+    all_packages: Dict[str, Dict[str, Any]],
+    rules: List[Dict[str, str]],
+    index: _NameIndex,
+) -> Set[str]:
+    """The packages matching any of the blacklist or whitelist entries.
+
+    Entries with a name pattern look up the packages of the matching names in
+    `index` and only match their other patterns against those. The remaining
+    entries are compiled with `_compile_rules` and matched against all
+    packages in one pass.
+    """
+    matched: Set[str] = set()
+    unnamed = []
+    for rule in rules or ():
+        rule = {key.lower(): pattern.lower() for key, pattern in rule.items()}
+        if "name" not in rule:
+            unnamed.append(rule)
+            continue
+        candidates = index.match(rule.pop("name"))
+        if rule:
+            matcher = _rule_matcher(rule)
+            candidates = [k for k in candidates if matcher(all_packages[k])]
+        matched.update(candidates)
+    if unnamed:
+        keys, matches = _compile_rules(unnamed)
+        matched.update(
+            pkg_name
+            for pkg_name, pkg_info in all_packages.items()
+            if matches(_package_values(pkg_info, keys))
+        )
     return matched
 
 
+def _filter_packages(
+    all_packages: Dict[str, Dict[str, Any]],
+    blacklist: List[Dict[str, str]],
+    whitelist: List[Dict[str, str]],
+    index: _NameIndex = None,
+) -> Tuple[Set[str], Set[str]]:
+    """Applies the blacklist and whitelist to packages.
+
+    Parameters
+    ----------
+    all_packages:
+        Dictionary mapping package filename to metadata dictionary representing
+        contents of repodata.json.
+    blacklist, whitelist:
+        The blacklist and whitelist entries, see `_match`.
+    index:
+        The name index of `all_packages`, built if not given.
+
+    Returns
+    -------
+    excluded : set
+        The packages which are blacklisted and not whitelisted.
+    whitelisted : set
+        The packages which are whitelisted.
+    """
+    if index is None:
+        index = _NameIndex(all_packages)
+    required = _match_rules(all_packages, whitelist, index)
+    excluded = _match_rules(all_packages, blacklist, index)
+    excluded.difference_update(required)
+    return excluded, required
+
+
 def _glob_matcher(pattern: str) -> Callable[[Any], bool]:
     """Returns a function that will match against given glob expression."""
+    if GLOB_CHARS.search(pattern):
+        return re.compile(fnmatch.translate(pattern)).match
 
     def _globmatch(v, p=pattern):
-        return fnmatch.fnmatch(v, p)
+        return v == p
 
     return _globmatch
 
@@ -142,7 +396,9 @@ def _glob_matcher(pattern: str) -> Callable[[Any], bool]:
 def _version_matcher(pattern: str) -> Callable[[Any], bool]:
     """Returns a function that will match against given conda version specifier."""
     # Throw away build string pattern if present.
-    return VersionSpec(pattern.split(" ")[0]).match
+    spec = VersionSpec(pattern.split(" ")[0])
+    # the spec trees of conda's VersionSpec are not compiled
+    return getattr(spec, "predicate", spec.match)
 
 
 def _build_matcher(pattern: str) -> Callable[[Any], bool]:
@@ -180,6 +436,10 @@ def _restore_required_dependencies(
     indirect dependencies of the `required` package list. It is assumed that the
     excluded and required sets are disjoint.
 
+    The excluded packages are indexed by name and each distinct dependency spec
+    is only matched once against the packages of that name, so the closure
+    touches every excluded package about once per spec naming it.
+
     Parameters
     ----------
     all_packages:
@@ -193,45 +453,151 @@ def _restore_required_dependencies(
     Returns
     -------
     New set of excluded packages with dependencies removed.
-    """
 
-    cur_required = set(required)
-
-    # TODO - support platform-specific + noarch
+    See `_restore_required_dependencies_across_subdirs` to also take the noarch
+    packages into account.
+    """
 
+    # names of the initially required packages, whose other versions are not
+    # restored as dependencies
     already_required = set(all_packages.get(r, {}).get("name") for r in required)
 
     final_excluded: Set[str] = set(excluded)
 
-    while len(final_excluded) > 0 and len(cur_required) > 0:
-        required_depend_specs: Dict[str, Set[str]] = {}
-
-        # collate version specs of dependencies package by package name
-        for req in cur_required:
-            info = all_packages.get(req, {})
-            for dep in info.get("depends", ()):
-                try:
-                    pkg_name, version_spec = dep.split(maxsplit=1)
-                except ValueError:
-                    pkg_name, version_spec = dep, ""
-                if pkg_name not in already_required:
-                    required_depend_specs.setdefault(pkg_name, set()).add(version_spec)
-
-        cur_required.clear()
-
-        for k in list(final_excluded):
-            info = all_packages.get(k, {})
-            pkg_name = info.get("name")
-            for version_spec in required_depend_specs.get(pkg_name, ()):
-                matcher = DependsMatcher(version_spec)
-                if matcher(info):
+    # index the excluded packages by name so that each dependency only looks
+    # at the packages it can match
+    candidates: Dict[str, List[str]] = {}
+    for k in final_excluded:
+        candidates.setdefault(all_packages.get(k, {}).get("name"), []).append(k)
+
+    matchers: Dict[str, DependsMatcher] = {}
+    # (name, version spec) pairs which were already looked up. Looking them
+    # up again cannot restore anything, as the candidates which did not match
+    # then still do not.
+    seen_specs: Set[Tuple[str, str]] = set()
+    worklist = list(required)
+    while worklist and final_excluded:
+        info = all_packages.get(worklist.pop(), {})
+        for dep in info.get("depends", ()):
+            try:
+                pkg_name, version_spec = dep.split(maxsplit=1)
+            except ValueError:
+                pkg_name, version_spec = dep, ""
+            if (
+                pkg_name in already_required
+                or pkg_name not in candidates
+                or (pkg_name, version_spec) in seen_specs
+            ):
+                continue
+            seen_specs.add((pkg_name, version_spec))
+            matcher = matchers.get(version_spec)
+            if matcher is None:
+                matcher = matchers[version_spec] = DependsMatcher(version_spec)
+            remaining = []
+            for k in candidates[pkg_name]:
+                if matcher(all_packages.get(k, {})):
                     final_excluded.remove(k)
-                    cur_required.add(k)
-                    break
+                    worklist.append(k)
+                else:
+                    remaining.append(k)
+            candidates[pkg_name] = remaining
+
+    return final_excluded
+
+
+def _restore_required_dependencies_across_subdirs(
+    subdir_packages: Dict[str, Dict[str, Dict[str, Any]]],
+    excluded: Dict[str, Set[str]],
+    required: Dict[str, Set[str]],
+) -> Dict[str, Set[str]]:
+    """Like `_restore_required_dependencies`, but for the packages of several
+    subdirs of a channel at once.
+
+    The dependencies of the packages of a platform subdir are looked up in
+    that subdir and in noarch, and those of noarch packages in noarch and in
+    every platform subdir, as conda would when installing them. A noarch
+    package stays excluded only if no platform requires it.
+
+    Parameters
+    ----------
+    subdir_packages:
+        Dictionary mapping subdir to the contents of its repodata.json, see
+        `_restore_required_dependencies`.
+    excluded:
+        Dictionary mapping subdir to its initial set of excluded packages.
+    required:
+        Dictionary mapping subdir to its initial set of required packages.
+
+    Returns
+    -------
+    Dictionary mapping subdir to its new set of excluded packages.
+    """
+    platforms = [subdir for subdir in subdir_packages if subdir != "noarch"]
+    if "noarch" not in subdir_packages or not platforms:
+        return {
+            subdir: _restore_required_dependencies(
+                packages, excluded[subdir], required[subdir]
+            )
+            for subdir, packages in subdir_packages.items()
+        }
 
+    final_excluded = {"noarch": set(excluded["noarch"])}
+    for platform in platforms:
+        # key the packages of both subdirs by (subdir, filename)
+        subdirs = (platform, "noarch")
+        all_packages = {
+            (subdir, pkg_name): pkg_info
+            for subdir in subdirs
+            for pkg_name, pkg_info in subdir_packages[subdir].items()
+        }
+        platform_excluded = _restore_required_dependencies(
+            all_packages,
+            {(subdir, pkg_name) for subdir in subdirs for pkg_name in excluded[subdir]},
+            {(subdir, pkg_name) for subdir in subdirs for pkg_name in required[subdir]},
+        )
+        final_excluded[platform] = {
+            pkg_name for subdir, pkg_name in platform_excluded if subdir == platform
+        }
+        final_excluded["noarch"].intersection_update(
+            pkg_name for subdir, pkg_name in platform_excluded if subdir == "noarch"
+        )
     return final_excluded
 
 
+class _SubdirClosure:
+    """Computes the dependency closure of `include_depends` across the
+    platforms of a channel which are mirrored concurrently, see
+    `_restore_required_dependencies_across_subdirs`.
+
+    Each platform hands its packages and its excluded and required packages
+    to `restore`, which returns the platform's new excluded packages once all
+    platforms have done so. A platform which fails before must `abort`, so
+    that the others do not wait for it forever.
+    """
+
+    def __init__(self, subdirs):
+        self._packages: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self._excluded: Dict[str, Set[str]] = {}
+        self._required: Dict[str, Set[str]] = {}
+        self._result: Dict[str, Set[str]] = {}
+        self._barrier = threading.Barrier(len(subdirs), action=self._restore)
+
+    def _restore(self):
+        self._result = _restore_required_dependencies_across_subdirs(
+            self._packages, self._excluded, self._required
+        )
+
+    def restore(self, subdir, packages, excluded, required):
+        self._packages[subdir] = packages
+        self._excluded[subdir] = excluded
+        self._required[subdir] = required
+        self._barrier.wait()
+        return self._result[subdir]
+
+    def abort(self):
+        self._barrier.abort()
+
+
 def _str_or_false(x: str) -> Union[str, bool]:
     """
     Returns a boolean False if x is the string "False" or similar.
@@ -281,13 +647,21 @@ def _make_arg_parser():
     )
     ap.add_argument(
         "--platform",
-        help=(f"The OS platform(s) to mirror. one of: {', '.join(DEFAULT_PLATFORMS)}"),
+        help=(
+            f"The OS platform(s) to mirror. one of: {', '.join(DEFAULT_PLATFORMS)}. "
+            "Several platforms can be given as a comma separated list and are "
+            "mirrored concurrently."
+        ),
     )
     ap.add_argument(
         "-D",
         "--include-depends",
         action="store_true",
-        help=("Include packages matching any dependencies of packages in whitelist."),
+        help=(
+            "Include packages matching any dependencies of packages in whitelist. "
+            "Dependencies are also looked up in noarch if it is one of the "
+            "platforms."
+        ),
     )
     ap.add_argument(
         "--latest",
@@ -338,6 +712,137 @@ def _make_arg_parser():
         type=int,
         help="Num of threads for validation. 1: Serial mode. 0: All available.",
     )
+    ap.add_argument(
+        "--download-workers",
+        action="store",
+        default=1,
+        type=int,
+        help=(
+            "Number of packages to download concurrently. Defaults to 1 "
+            "(serial downloads)."
+        ),
+    )
+    ap.add_argument(
+        "--download-backend",
+        choices=DOWNLOAD_BACKENDS,
+        default="requests",
+        help=(
+            "Implementation used for downloading packages. 'asyncio' requires "
+            "aiohttp. Defaults to 'requests'."
+        ),
+    )
+    ap.add_argument(
+        "--connections-per-host",
+        type=int,
+        default=0,
+        help=(
+            "Maximum number of simultaneous connections per host with the "
+            "asyncio download backend. 0: no limit besides --download-workers."
+        ),
+    )
+    ap.add_argument(
+        "--max-bandwidth",
+        type=float,
+        default=None,
+        help=(
+            "Limit the total download rate of packages to this many megabytes "
+            "per second, shared by all platforms and channels of the run. "
+            "Defaults to no limit."
+        ),
+    )
+    ap.add_argument(
+        "--repodata-cache-dir",
+        help=(
+            "Directory in which to cache the upstream repodata between runs. "
+            "Unchanged repodata is not downloaded again and a run is skipped "
+            "if neither the repodata nor the configuration changed since the "
+            "last complete run."
+        ),
+        default=None,
+    )
+    ap.add_argument(
+        "--use-jlap",
+        action="store_true",
+        help=(
+            "Update the cached repodata by applying the patches from the "
+            "channel's repodata.jlap instead of downloading it in full. "
+            "Requires --repodata-cache-dir."
+        ),
+        default=False,
+    )
+    ap.add_argument(
+        "--stream-repodata",
+        action="store_true",
+        help=(
+            "Parse the upstream repodata incrementally and only keep the "
+            "metadata of packages that are not blacklisted, which reduces "
+            "memory usage for large channels. Has no effect with "
+            "--include-depends."
+        ),
+        default=False,
+    )
+    ap.add_argument(
+        "--validation-cache",
+        action="store_true",
+        help=(
+            "Remember which packages in the mirror passed validation and do "
+            "not validate them again until they change."
+        ),
+        default=False,
+    )
+    ap.add_argument(
+        "--validation-cache-max-age",
+        type=float,
+        help=(
+            "Validate cached packages again once their last validation is "
+            "older than this many days. 0 forces a full validation. Defaults "
+            "to no limit."
+        ),
+        default=None,
+    )
+    ap.add_argument(
+        "--validation-cache-dir",
+        help=(
+            "Directory in which to keep the validation cache, outside of the "
+            "published mirror. Defaults to --repodata-cache-dir if given, "
+            "else to a 'validation-cache' directory in --temp-directory."
+        ),
+        default=None,
+    )
+    ap.add_argument(
+        "--validation-executor",
+        choices=VALIDATION_EXECUTORS,
+        default="process",
+        help=(
+            "Whether concurrent validation uses a pool of processes or of "
+            "threads. Threads save the start-up of the processes and passing "
+            "every package to and from them, and still hash in parallel since "
+            "hashlib releases the GIL on large buffers. Defaults to 'process'."
+        ),
+    )
+    ap.add_argument(
+        "--hash-policy",
+        choices=HASH_POLICIES,
+        default=DEFAULT_HASH_POLICY,
+        help=(
+            "Which digests from the repodata packages are verified against. "
+            "'prefer-sha256' verifies the sha256 if available and the md5 "
+            "otherwise, 'all' verifies every available digest in a single "
+            "pass. Defaults to 'prefer-sha256'."
+        ),
+    )
+    ap.add_argument(
+        "--watch",
+        metavar="INTERVAL",
+        type=float,
+        default=None,
+        help=(
+            "Keep running and mirror again every INTERVAL seconds, polling "
+            "the upstream repodata with conditional requests and only "
+            "applying what changed. Errors are logged and fail only their "
+            "cycle."
+        ),
+    )
     ap.add_argument(
         "--version",
         action="store_true",
@@ -481,8 +986,18 @@ def _parse_and_format_args():
 
     blacklist = config_dict.get("blacklist")
     whitelist = config_dict.get("whitelist")
+    channels = config_dict.get("channels")
 
-    for required in ("target_directory", "platform", "upstream_channel"):
+    if channels:
+        # the channels and their platforms are taken from the config file
+        if args.upstream_channel:
+            raise ValueError(
+                "upstream_channel cannot be combined with channels in the config"
+            )
+        required_args = ("target_directory",)
+    else:
+        required_args = ("target_directory", "platform", "upstream_channel")
+    for required in required_args:
         if not getattr(args, required):
             raise ValueError("Missing command line argument: %s", required)
 
@@ -522,6 +1037,17 @@ def _parse_and_format_args():
         "temp_directory": args.temp_directory,
         "platform": args.platform,
         "num_threads": args.num_threads,
+        "download_workers": args.download_workers,
+        "download_backend": args.download_backend,
+        "connections_per_host": args.connections_per_host,
+        "repodata_cache_dir": args.repodata_cache_dir,
+        "use_jlap": args.use_jlap,
+        "stream_repodata": args.stream_repodata,
+        "validation_cache": args.validation_cache,
+        "validation_cache_max_age": args.validation_cache_max_age,
+        "validation_cache_dir": args.validation_cache_dir,
+        "validation_executor": args.validation_executor,
+        "hash_policy": args.hash_policy,
         "blacklist": blacklist,
         "whitelist": whitelist,
         "include_depends": args.include_depends,
@@ -534,12 +1060,27 @@ def _parse_and_format_args():
         "ssl_verify": args.ssl_verify,
         "max_retries": args.max_retries,
         "show_progress": args.show_progress,
+        "max_bandwidth": args.max_bandwidth,
+        "channels": channels,
+        "watch": args.watch,
     }
 
 
 def cli():
-    """Thin wrapper around parsing the cli args and calling main with them"""
-    main(**_parse_and_format_args())
+    """Thin wrapper around parsing the cli args and calling main (or
+    mirror_channels if the config lists several channels, or watch if
+    --watch is given) with them"""
+    kwargs = _parse_and_format_args()
+    interval = kwargs.pop("watch")
+    if interval is not None:
+        watch(interval, **kwargs)
+        return
+    channels = kwargs.pop("channels")
+    if channels:
+        del kwargs["upstream_channel"]
+        mirror_channels(channels, **kwargs)
+    else:
+        main(**kwargs)
 
 
 def _remove_package(pkg_path, reason):
@@ -569,10 +1110,68 @@ def _remove_package(pkg_path, reason):
     return pkg_path, msg
 
 
-def _validate(filename, md5=None, size=None):
+def _expected_digests(hash_policy, md5=None, sha256=None) -> Dict[str, str]:
+    """The digests to verify a package against under `hash_policy`.
+
+    Parameters
+    ----------
+    hash_policy : {'md5', 'sha256', 'prefer-sha256', 'all'}
+        'prefer-sha256' verifies the sha256 if the repodata provides one and
+        the md5 otherwise, 'all' verifies every digest the repodata provides.
+    md5, sha256 : str, optional
+        The digests from the repodata of the package.
+
+    Returns
+    -------
+    dict
+        Mapping of hashlib algorithm names to expected hex digests. Empty if
+        the repodata lacks the digests selected by the policy.
+    """
+    available = {"md5": md5, "sha256": sha256}
+    if hash_policy == "prefer-sha256":
+        algorithms = ["sha256"] if sha256 else ["md5"]
+    elif hash_policy == "all":
+        algorithms = ["md5", "sha256"]
+    elif hash_policy in available:
+        algorithms = [hash_policy]
+    else:
+        raise ValueError("Unknown hash policy: %s" % hash_policy)
+    return {
+        algorithm: available[algorithm]
+        for algorithm in algorithms
+        if available[algorithm]
+    }
+
+
+def _hash_file(filename, hashers, buffer_size=VALIDATION_BUFFER_SIZE):
+    """Update each of `hashers` with the contents of the file at `filename`.
+
+    The file is read once into a single reused buffer of `buffer_size` bytes,
+    so memory usage does not depend on the size of the file and computing
+    several digests costs no extra I/O.
+    """
+    buf = bytearray(buffer_size)
+    view = memoryview(buf)
+    with open(filename, "rb", buffering=0) as f:
+        while True:
+            n = f.readinto(buf)
+            if not n:
+                break
+            for hasher in hashers:
+                hasher.update(view[:n])
+
+
+def _validate(
+    filename,
+    md5=None,
+    size=None,
+    buffer_size=VALIDATION_BUFFER_SIZE,
+    sha256=None,
+    hash_policy=DEFAULT_HASH_POLICY,
+):
     """Validate the conda package tarfile located at `filename` with any of the
-    passed in options `md5` or `size. Also implicitly validate that
-    the conda package is a valid tarfile.
+    passed in options `md5`, `sha256` or `size. Also implicitly validate that
+    the conda package is a valid tarfile or, for .conda packages, zip file.
 
     NOTE: Removes packages that fail validation
 
@@ -585,6 +1184,13 @@ def _validate(filename, md5=None, size=None):
     size : int, optional
         if provided, stat the file at `filename` and make sure its size
         matches `size`
+    buffer_size : int, optional
+        Size in bytes of the chunks in which the file is read for hashing.
+    sha256 : str, optional
+        If provided, perform a `sha256sum` on `filename` and compare to `sha256`
+    hash_policy : {'md5', 'sha256', 'prefer-sha256', 'all'}, optional
+        Which of the provided digests to verify, see `_expected_digests`. They
+        are computed in a single pass over the file.
 
     Returns
     -------
@@ -593,80 +1199,836 @@ def _validate(filename, md5=None, size=None):
     reason : str
         The reason why the package is being removed
     """
-    if md5:
-        calc = hashlib.md5(open(filename, "rb").read()).hexdigest()
-        if calc == md5:
-            # If the MD5 matches, skip the other checks
-            return filename, None
-        else:
-            return _remove_package(
-                filename,
-                reason="Failed md5 validation. Expected: %s. Computed: %s"
-                % (calc, md5),
-            )
+    expected = _expected_digests(hash_policy, md5=md5, sha256=sha256)
+    if expected:
+        hashes = {algorithm: hashlib.new(algorithm) for algorithm in expected}
+        _hash_file(filename, hashes.values(), buffer_size)
+        for algorithm, digest in expected.items():
+            calc = hashes[algorithm].hexdigest()
+            if calc != digest:
+                return _remove_package(
+                    filename,
+                    reason="Failed %s validation. Expected: %s. Computed: %s"
+                    % (algorithm, digest, calc),
+                )
+        # If the digests match, skip the other checks
+        return filename, None
 
     if size and size != os.stat(filename).st_size:
         return _remove_package(filename, reason="Failed size test")
 
+    reason = _check_package_structure(filename)
+    if reason is not None:
+        return _remove_package(filename, reason=reason)
+
+    return filename, None
+
+
+def _check_package_structure(filename):
+    """Check that the package at `filename` is a well-formed conda package
+    without reading more of it than necessary.
+
+    .conda packages are zip files. Only their central directory is read to
+    check that they contain the info-*.tar.zst member. .tar.bz2 packages are
+    decompressed as a stream only until their info/index.json is found.
+
+    Returns
+    -------
+    reason : str or None
+        Why the package is malformed, None if it is well-formed.
+    """
+    if filename.endswith(".conda"):
+        try:
+            with zipfile.ZipFile(filename) as z:
+                names = z.namelist()
+        except (zipfile.BadZipFile, OSError):
+            logger.info(
+                "Validation failed because conda package is corrupted.", exc_info=True
+            )
+            return "Zipfile read failure"
+        if not any(fnmatch.fnmatch(name, "info-*.tar.zst") for name in names):
+            return "Zipfile has no info-*.tar.zst member"
+        return None
+
     try:
-        with tarfile.open(filename) as t:
-            t.extractfile("info/index.json").read().decode("utf-8")
+        with tarfile.open(filename, "r|*") as t:
+            for member in t:
+                if member.name in ("info/index.json", "./info/index.json"):
+                    t.extractfile(member).read().decode("utf-8")
+                    return None
     except (tarfile.TarError, EOFError):
         logger.info(
             "Validation failed because conda package is corrupted.", exc_info=True
         )
-        return _remove_package(filename, reason="Tarfile read failure")
+        return "Tarfile read failure"
+    return "Tarfile has no info/index.json member"
 
-    return filename, None
 
+class PackageHasher:
+    """Incrementally computes the digests of a package while it is being
+    written and checks them against the package's repodata entry.
 
-def get_repodata(channel, platform, proxies=None, ssl_verify=None):
-    """Get the repodata.json file for a channel/platform combo on anaconda.org
+    Which digests are computed is decided by `hash_policy`, see
+    `_expected_digests`.
+    """
+
+    def __init__(
+        self, pkg_info: Dict[str, Any] = None, hash_policy: str = DEFAULT_HASH_POLICY
+    ):
+        pkg_info = pkg_info or {}
+        self.expected = _expected_digests(
+            hash_policy, md5=pkg_info.get("md5"), sha256=pkg_info.get("sha256")
+        )
+        self.expected_size = pkg_info.get("size")
+        self.reset()
+
+    def reset(self):
+        """Forget all data seen so far."""
+        self.hashes = {algorithm: hashlib.new(algorithm) for algorithm in self.expected}
+        self.size = 0
+
+    def update(self, data: bytes):
+        for h in self.hashes.values():
+            h.update(data)
+        self.size += len(data)
+
+    @property
+    def verifiable(self) -> bool:
+        """Whether the repodata entry provides any digest to verify against."""
+        return bool(self.expected)
+
+    def verify(self) -> Union[str, None]:
+        """Returns the reason why the data seen so far does not match the
+        repodata entry or None if it does."""
+        if self.expected_size and self.size != self.expected_size:
+            return "Failed size test"
+        for algorithm, expected in self.expected.items():
+            calc = self.hashes[algorithm].hexdigest()
+            if calc != expected:
+                return "Failed %s validation. Expected: %s. Computed: %s" % (
+                    algorithm,
+                    expected,
+                    calc,
+                )
+        return None
 
-    Parameters
-    ----------
-    channel : str
-        anaconda.org/CHANNEL
-    platform : {'linux-64', 'linux-32', 'osx-64', 'win-32', 'win-64'}
-        The platform of interest
-    proxies : dict
-        Proxys for connecting internet
-    ssl_verify : str or bool
-        Path to a CA_BUNDLE file or directory with certificates of trusted CAs
+
+def _check_download(download_filename, hasher: PackageHasher):
+    """Check a downloaded package using the digests computed while streaming.
+
+    NOTE: Removes packages that fail validation
 
     Returns
     -------
-    info : dict
-    packages : dict
-        keyed on package name (e.g., twisted-16.0.0-py35_0.tar.bz2)
+    tuple or None
+        None if the package could not be verified while streaming because its
+        repodata entry has no digests. Otherwise a twople of (pkg_path, reason)
+        like `_validate` returns, where reason is None for valid packages.
     """
-    url_template, channel = _maybe_split_channel(channel)
-    url = url_template.format(
-        channel=channel, platform=platform, file_name="repodata.json"
-    )
+    if not hasher.verifiable:
+        return None
+    reason = hasher.verify()
+    if reason is None:
+        return download_filename, None
+    return _remove_package(download_filename, reason=reason)
 
-    resp = requests.get(url, proxies=proxies, verify=ssl_verify).json()
-    info = resp.get("info", {})
-    packages = resp.get("packages", {})
-    packages.update(resp.get("packages.conda", {}))
-    # Patch the repodata.json so that all package info dicts contain a "subdir"
-    # key.  Apparently some channels on anaconda.org do not contain the
-    # 'subdir' field. I think this this might be relegated to the
-    # Continuum-provided channels only, actually.
-    for pkg_name, pkg_info in packages.items():
-        pkg_info.setdefault("subdir", platform)
-    return info, packages
 
+class RepodataCache:
+    """Local copy of the upstream repodata.json of one channel/platform.
 
-def _download(
-    url,
-    target_directory,
-    session: requests.Session,
+    Next to the raw repodata.json the cache keeps a small state file with the
+    url it was fetched from and the ETag and Last-Modified headers of that
+    response, so that later runs can make conditional requests and skip the
+    download entirely when nothing changed upstream.
+    """
+
+    def __init__(self, cache_dir, channel, platform):
+        self.directory = os.path.join(cache_dir, channel, platform)
+        self.path = os.path.join(self.directory, "repodata.json")
+        self.state_path = os.path.join(self.directory, "state.json")
+        try:
+            with open(self.state_path) as f:
+                self.state = json.load(f)
+        except (OSError, ValueError):
+            self.state = {}
+
+    def conditional_headers(self, url) -> Dict[str, str]:
+        """Headers which make a request for `url` return 304 if the cached
+        copy was downloaded from `url` and is still current."""
+        headers = {}
+        if self.state.get("url") == url and os.path.exists(self.path):
+            if self.state.get("etag"):
+                headers["If-None-Match"] = self.state["etag"]
+            if self.state.get("last_modified"):
+                headers["If-Modified-Since"] = self.state["last_modified"]
+        return headers
+
+    def fetch(
+        self, url, session=None, proxies=None, ssl_verify=None, use_jlap=False
+    ) -> bool:
+        """Bring the cached copy up to date with the repodata.json at `url`.
+
+        The cached copy is always stored uncompressed, but it is downloaded
+        in the most compact form the server provides, see
+        `_request_repodata`. With `use_jlap`, an existing copy is instead
+        patched from the channel's repodata.jlap if possible, see
+        `fetch_jlap`.
+
+        Returns
+        -------
+        modified : bool
+            False if the server reported that the cached copy is current.
+        """
+        if use_jlap and self.state.get("have") and os.path.exists(self.path):
+            try:
+                return self.fetch_jlap(
+                    url, session, proxies=proxies, ssl_verify=ssl_verify
+                )
+            except (requests.RequestException, ValueError, LookupError, TypeError) as e:
+                logger.warning(
+                    "Could not update %s from its patches, downloading it "
+                    "in full. Reason: %s",
+                    url,
+                    e,
+                )
+
+        variant_url, resp, compression = _request_repodata(
+            url,
+            session,
+            proxies=proxies,
+            ssl_verify=ssl_verify,
+            headers_for=self.conditional_headers,
+            preferred=self.state.get("url"),
+        )
+        if resp.status_code == 304:
+            logger.info("%s has not changed since it was cached", resp.url)
+            resp.close()
+            return False
+
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = self.path + ".part"
+        have = hashlib.blake2b(digest_size=32)
+        with open(tmp_path, "wb") as f:
+            _copy_repodata(resp, compression, f, have)
+        os.replace(tmp_path, self.path)
+        self.state = {
+            "url": variant_url,
+            "etag": resp.headers.get("ETag"),
+            "last_modified": resp.headers.get("Last-Modified"),
+            "have": have.hexdigest(),
+        }
+        self.save_state()
+        return True
+
+    def fetch_jlap(self, url, session=None, proxies=None, ssl_verify=None) -> bool:
+        """Patch the cached copy up to date from the repodata.jlap next to the
+        repodata.json at `url`.
+
+        Only the part of repodata.jlap which was added since the last call is
+        requested. Every line of it is verified against the blake2b hash chain
+        of the file before the patches leading from the cached version to the
+        latest one are applied.
+
+        Raises
+        ------
+        ValueError, LookupError
+            If the patches cannot be verified or do not lead from the cached
+            version to the latest one. The cached copy is left untouched.
+        """
+        session = session or requests
+        jlap_url = url[: -len("repodata.json")] + "repodata.jlap"
+        jlap = self.state.get("jlap") or {}
+        pos = jlap.get("pos", 0)
+        headers = {"Range": "bytes=%d-" % pos} if pos else {}
+        resp = session.get(
+            jlap_url, headers=headers, proxies=proxies, verify=ssl_verify
+        )
+        if pos and resp.status_code == 416:
+            # the file was truncated upstream, start over
+            pos = 0
+            resp = session.get(jlap_url, proxies=proxies, verify=ssl_verify)
+        resp.raise_for_status()
+        if pos and not _range_honoured(pos, resp.status_code, resp.headers):
+            pos = 0
+        lines = resp.content.split(b"\n")
+        if lines[-1] == b"":
+            lines.pop()
+        if pos:
+            iv = bytes.fromhex(jlap["iv"])
+        else:
+            iv_line = lines.pop(0)
+            pos = len(iv_line) + 1
+            iv = bytes.fromhex(iv_line.decode())
+        hashes = _verify_jlap(iv, lines)
+        patches = [json.loads(line) for line in lines[:-2]]
+        footer = json.loads(lines[-2])
+
+        have = self.state["have"]
+        needed = _jlap_patch_chain(patches, have, footer["latest"])
+        if needed:
+            logger.info("Applying %d patches to %s", len(needed), self.path)
+            repodata = self.load()
+            for patch in needed:
+                repodata = _apply_json_patch(repodata, patch["patch"])
+            os.makedirs(self.directory, exist_ok=True)
+            tmp_path = self.path + ".part"
+            with open(tmp_path, "w") as f:
+                json.dump(repodata, f)
+            os.replace(tmp_path, self.path)
+            # the re-serialized json does not hash like the upstream file, so
+            # the hash verified through the patch chain is recorded instead
+            self.state["have"] = footer["latest"]
+            self.state.pop("mirrored", None)
+        else:
+            logger.info("%s has not changed since it was cached", url)
+
+        # next time only request what is appended after the last patch
+        if patches:
+            pos += sum(len(line) + 1 for line in lines[:-2])
+            iv = hashes[-2]
+        self.state["jlap"] = {"pos": pos, "iv": iv.hex()}
+        self.save_state()
+        return bool(needed)
+
+    def load(self) -> Dict[str, Any]:
+        """Parse the cached repodata.json."""
+        with open(self.path, "rb") as f:
+            return json.load(f)
+
+    def save_state(self):
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = self.state_path + ".part"
+        with open(tmp_path, "w") as f:
+            json.dump(self.state, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.state_path)
+
+
+def _repodata_variants(url, preferred=None):
+    """Urls under which the repodata.json at `url` may be available, most
+    compact first, paired with their compression.
+
+    zstd is only considered if the zstandard package is installed. The plain
+    repodata.json is still transferred gzip encoded if the server supports it
+    since requests sends `Accept-Encoding: gzip, deflate` by default.
+    """
+    variants = [(url + ".bz2", "bz2"), (url, None)]
+    if zstandard is not None:
+        variants.insert(0, (url + ".zst", "zst"))
+    # try the variant which worked last time first
+    variants.sort(key=lambda variant: variant[0] != preferred)
+    return variants
+
+
+def _request_repodata(
+    url,
+    session=None,
+    *,
+    proxies=None,
+    ssl_verify=None,
+    headers_for: Callable[[str], Dict[str, str]] = None,
+    preferred=None,
+):
+    """Request the most compact variant of the repodata.json at `url` which
+    the server provides.
+
+    Parameters
+    ----------
+    url : str
+        The url of the uncompressed repodata.json
+    session : requests.Session, optional
+    proxies : dict
+        Proxys for connecting internet
+    ssl_verify : str or bool
+        Path to a CA_BUNDLE file or directory with certificates of trusted CAs
+    headers_for : callable, optional
+        Returns the extra request headers to send for a variant url.
+    preferred : str, optional
+        Variant url to try first.
+
+    Returns
+    -------
+    variant_url : str
+        The url which was finally requested.
+    resp : requests.Response
+        The streamed response. Either successful or 304 Not Modified.
+    compression : str or None
+        'zst', 'bz2' or None for uncompressed data.
+    """
+    session = session or requests
+    for variant_url, compression in _repodata_variants(url, preferred):
+        headers = headers_for(variant_url) if headers_for else {}
+        resp = session.get(
+            variant_url,
+            headers=headers,
+            stream=True,
+            proxies=proxies,
+            verify=ssl_verify,
+        )
+        if compression is not None and 400 <= resp.status_code < 500:
+            logger.debug("%s is not available, trying the next variant", variant_url)
+            resp.close()
+            continue
+        if resp.status_code != 304:
+            resp.raise_for_status()
+        return variant_url, resp, compression
+
+
+def _copy_repodata(resp, compression, fileobj, hasher=None):
+    """Write the body of `resp` to `fileobj`, decompressing it on the fly.
+
+    If given, `hasher` is updated with the decompressed data.
+    """
+    if compression == "zst":
+        decompressor = zstandard.ZstdDecompressor().decompressobj()
+    elif compression == "bz2":
+        decompressor = bz2.BZ2Decompressor()
+    else:
+        decompressor = None
+    for data in resp.iter_content(DEFAULT_CHUNK_SIZE):
+        if decompressor is not None:
+            data = decompressor.decompress(data)
+        if hasher is not None:
+            hasher.update(data)
+        fileobj.write(data)
+
+
+def _verify_jlap(iv, lines):
+    """Verify the hash chain of the lines of a repodata.jlap file.
+
+    Each line is hashed with blake2b keyed with the hash of the line before
+    it, `iv` for the first line. The last line must be the hex digest of the
+    line before it.
+
+    Returns
+    -------
+    hashes : list of bytes
+        The hash of each line but the last.
+    """
+    if len(lines) < 2:
+        raise ValueError("Incomplete jlap data")
+    hashes = []
+    digest = iv
+    for line in lines[:-1]:
+        digest = hashlib.blake2b(line, key=digest, digest_size=32).digest()
+        hashes.append(digest)
+    if lines[-1].decode() != digest.hex():
+        raise ValueError("jlap checksum mismatch")
+    return hashes
+
+
+def _jlap_patch_chain(patches, have, latest):
+    """The patches leading from the version hashed `have` to `latest`, in the
+    order in which they have to be applied."""
+    by_target = {patch["to"]: patch for patch in patches}
+    chain = []
+    while latest != have:
+        patch = by_target.get(latest)
+        if patch is None:
+            raise LookupError("No patch leads from %s to %s" % (have, latest))
+        chain.append(patch)
+        latest = patch["from"]
+    chain.reverse()
+    return chain
+
+
+def _json_pointer(pointer):
+    """Split a JSON pointer (RFC 6901) into its reference tokens."""
+    if not pointer:
+        return []
+    if not pointer.startswith("/"):
+        raise ValueError("Invalid JSON pointer: %r" % pointer)
+    return [
+        token.replace("~1", "/").replace("~0", "~") for token in pointer[1:].split("/")
+    ]
+
+
+def _json_pointer_parent(doc, pointer):
+    tokens = _json_pointer(pointer)
+    if not tokens:
+        raise ValueError("JSON pointer %r has no parent" % pointer)
+    for token in tokens[:-1]:
+        doc = doc[int(token)] if isinstance(doc, list) else doc[token]
+    return doc, tokens[-1]
+
+
+def _json_pointer_get(doc, pointer):
+    if not pointer:
+        return doc
+    parent, key = _json_pointer_parent(doc, pointer)
+    return parent[int(key)] if isinstance(parent, list) else parent[key]
+
+
+def _apply_json_patch(doc, patch):
+    """Apply a JSON patch (RFC 6902) to `doc` in place.
+
+    Returns
+    -------
+    doc : object
+        The patched document, which is a new object if the patch replaces
+        the whole document.
+    """
+    for operation in patch:
+        op, path = operation["op"], operation["path"]
+        if op == "test":
+            if _json_pointer_get(doc, path) != operation["value"]:
+                raise ValueError("JSON patch test failed at %r" % path)
+            continue
+        if op in ("move", "copy"):
+            value = copy.deepcopy(_json_pointer_get(doc, operation["from"]))
+            if op == "move":
+                doc = _apply_json_patch(
+                    doc, [{"op": "remove", "path": operation["from"]}]
+                )
+        elif op in ("add", "replace"):
+            value = operation["value"]
+        elif op != "remove":
+            raise ValueError("Unknown JSON patch operation %r" % op)
+
+        if not path:
+            if op == "remove":
+                raise ValueError("Cannot remove the whole document")
+            doc = value
+            continue
+        parent, key = _json_pointer_parent(doc, path)
+        if isinstance(parent, list):
+            index = len(parent) if key == "-" else int(key)
+            if op == "remove":
+                del parent[index]
+            elif op == "replace":
+                parent[index] = value
+            else:
+                if index > len(parent):
+                    raise IndexError("JSON patch index out of range at %r" % path)
+                parent.insert(index, value)
+        elif op == "remove":
+            del parent[key]
+        else:
+            if op == "replace" and key not in parent:
+                raise KeyError(key)
+            parent[key] = value
+    return doc
+
+
+def _repodata_url(channel, platform):
+    url_template, channel = _maybe_split_channel(channel)
+    return url_template.format(
+        channel=channel, platform=platform, file_name="repodata.json"
+    )
+
+
+def _split_repodata(repodata, platform):
+    """Split the contents of repodata.json into its info and a single
+    packages dict covering both the .tar.bz2 and the .conda packages."""
+    info = repodata.get("info", {})
+    packages = repodata.get("packages", {})
+    packages.update(repodata.get("packages.conda", {}))
+    # Patch the repodata.json so that all package info dicts contain a "subdir"
+    # key.  Apparently some channels on anaconda.org do not contain the
+    # 'subdir' field. I think this this might be relegated to the
+    # Continuum-provided channels only, actually.
+    for pkg_name, pkg_info in packages.items():
+        pkg_info.setdefault("subdir", platform)
+    return info, packages
+
+
+class _JSONStream:
+    """Incremental reader for a JSON document in a binary file object.
+
+    Only the part of the file which has not been consumed yet is kept in
+    memory. Complete values are decoded with `json.JSONDecoder.raw_decode`.
+    """
+
+    _whitespace = re.compile(r"[ \t\n\r]*")
+
+    def __init__(self, fileobj, chunk_size=1024 * 1024, object_pairs_hook=None):
+        self._fileobj = fileobj
+        self._chunk_size = chunk_size
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+        self._json = json.JSONDecoder(object_pairs_hook=object_pairs_hook)
+        self._buf = ""
+        self._pos = 0
+        self._eof = False
+
+    def _fill(self):
+        data = self._fileobj.read(self._chunk_size)
+        self._eof = not data
+        pos, self._pos = self._pos, 0
+        self._buf = self._buf[pos:] + self._decoder.decode(data, self._eof)
+
+    def _skip_whitespace(self):
+        while True:
+            self._pos = self._whitespace.match(self._buf, self._pos).end()
+            if self._pos < len(self._buf) or self._eof:
+                return
+            self._fill()
+
+    def char(self, expected: str) -> str:
+        """Consume one of the structural characters in `expected`."""
+        self._skip_whitespace()
+        char = self._buf[self._pos] if self._pos < len(self._buf) else ""
+        if not char or char not in expected:
+            raise ValueError(
+                "Expected one of %r in JSON data but found %r" % (expected, char)
+            )
+        self._pos += 1
+        return char
+
+    def value(self) -> Any:
+        """Consume and decode a complete value."""
+        self._skip_whitespace()
+        while True:
+            try:
+                value, end = self._json.raw_decode(self._buf, self._pos)
+            except ValueError:
+                if self._eof:
+                    raise
+            else:
+                # a number at the end of the buffer may continue in the file
+                if end < len(self._buf) or self._eof:
+                    self._pos = end
+                    return value
+            self._fill()
+
+    def keys(self) -> Iterable[str]:
+        """Consume an object, yielding its keys. The value of each key has to
+        be consumed before the next key is requested."""
+        self.char("{")
+        self._skip_whitespace()
+        if self._buf.startswith("}", self._pos):
+            self._pos += 1
+            return
+        while True:
+            key = self.value()
+            if not isinstance(key, str):
+                raise ValueError("Expected a string key in JSON data")
+            self.char(":")
+            yield key
+            if self.char(",}") == "}":
+                return
+
+
+def _stream_repodata(
+    fileobj, keep: Callable[[str, Dict[str, Any]], bool], object_pairs_hook=None
+):
+    """Parse repodata.json from the binary `fileobj`, only retaining the
+    package metadata dicts for which `keep(pkg_name, pkg_info)` is true.
+
+    The records are parsed one at a time, so memory usage scales with the
+    retained records rather than with the whole repodata. `object_pairs_hook`
+    is passed on to `json.JSONDecoder`.
+    """
+    stream = _JSONStream(fileobj, object_pairs_hook=object_pairs_hook)
+    repodata = {}
+    for key in stream.keys():
+        if key in ("packages", "packages.conda"):
+            packages = repodata[key] = {}
+            for pkg_name in stream.keys():
+                pkg_info = stream.value()
+                if keep(pkg_name, pkg_info):
+                    packages[pkg_name] = pkg_info
+        else:
+            repodata[key] = stream.value()
+    return repodata
+
+
+class _CompactRecords:
+    """`object_pairs_hook` for `json.load` which makes the decoded package
+    metadata dicts share their keys and the equal values of the fields in
+    `SHARED_FIELDS`, such as licenses or dependency specs, and stores lists of
+    strings as tuples.
+
+    The decoder only shares the keys of the objects decoded by a single call,
+    and otherwise every string in a repodata.json is a separate object. Values
+    which are unique to a package, such as its digests, are not shared, as
+    they would stay in the table of shared strings for the whole parse even
+    if the package is not kept. Neither are the keys of objects such as
+    `packages` whose values are objects themselves, which are filenames.
+    """
+
+    SHARED_FIELDS = frozenset(
+        (
+            "arch",
+            "constrains",
+            "depends",
+            "license",
+            "license_family",
+            "name",
+            "noarch",
+            "platform",
+            "subdir",
+            "track_features",
+            "version",
+        )
+    )
+
+    def __init__(self):
+        self._strings: Dict[str, str] = {}
+
+    def __call__(self, pairs):
+        strings = self._strings
+        record = {}
+        for key, value in pairs:
+            if isinstance(value, dict):
+                record[key] = value
+                continue
+            key = strings.setdefault(key, key)
+            shared = key in self.SHARED_FIELDS
+            if isinstance(value, str):
+                if shared:
+                    value = strings.setdefault(value, value)
+            elif isinstance(value, list) and all(isinstance(v, str) for v in value):
+                if shared:
+                    value = tuple(strings.setdefault(v, v) for v in value)
+                else:
+                    value = tuple(value)
+            record[key] = value
+        return record
+
+
+def _parse_repodata(fileobj, platform, keep=None):
+    """Parse repodata.json from the binary `fileobj` into its info and
+    packages, see `_split_repodata`. If given, `keep` filters the packages
+    while they are parsed, see `_stream_repodata`.
+
+    The package metadata dicts are compacted as they are decoded, see
+    `_CompactRecords`.
+    """
+    compact = _CompactRecords()
+    if keep is None:
+        repodata = json.load(fileobj, object_pairs_hook=compact)
+    else:
+        repodata = _stream_repodata(fileobj, keep, object_pairs_hook=compact)
+    return _split_repodata(repodata, platform)
+
+
+def get_repodata(
+    channel,
+    platform,
+    proxies=None,
+    ssl_verify=None,
+    cache_dir=None,
+    use_jlap=False,
+    keep=None,
+):
+    """Get the repodata.json file for a channel/platform combo on anaconda.org
+
+    The repodata is downloaded zstd or bzip2 compressed if the channel
+    provides it in that form.
+
+    Parameters
+    ----------
+    channel : str
+        anaconda.org/CHANNEL
+    platform : {'linux-64', 'linux-32', 'osx-64', 'win-32', 'win-64'}
+        The platform of interest
+    proxies : dict
+        Proxys for connecting internet
+    ssl_verify : str or bool
+        Path to a CA_BUNDLE file or directory with certificates of trusted CAs
+    cache_dir : str, optional
+        If given, keep a copy of the repodata in this directory and only
+        download it again if it changed upstream. See `RepodataCache`.
+    use_jlap : bool, optional
+        Update the cached repodata from the channel's repodata.jlap patches
+        instead of downloading it in full. Requires `cache_dir`.
+    keep : callable, optional
+        If given, the repodata is parsed incrementally and only packages for
+        which `keep(pkg_name, pkg_info)` is true are returned.
+
+    Returns
+    -------
+    info : dict
+    packages : dict
+        keyed on package name (e.g., twisted-16.0.0-py35_0.tar.bz2)
+    """
+    url = _repodata_url(channel, platform)
+
+    if cache_dir:
+        _, channel_name = _maybe_split_channel(channel)
+        cache = RepodataCache(cache_dir, channel_name, platform)
+        cache.fetch(url, proxies=proxies, ssl_verify=ssl_verify, use_jlap=use_jlap)
+        with open(cache.path, "rb") as f:
+            return _parse_repodata(f, platform, keep)
+
+    _, resp, compression = _request_repodata(
+        url, proxies=proxies, ssl_verify=ssl_verify
+    )
+    with tempfile.TemporaryFile() as f:
+        _copy_repodata(resp, compression, f)
+        f.seek(0)
+        return _parse_repodata(f, platform, keep)
+
+
+def _config_fingerprint(**config) -> str:
+    """Digest of the configuration of a mirror run, used to tell whether a
+    previous run with unchanged upstream repodata can be skipped."""
+    data = json.dumps(config, sort_keys=True, default=str)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+def _resume_offset(download_filename, hasher: PackageHasher = None) -> int:
+    """Number of bytes of an interrupted download of `download_filename` which
+    can be kept when resuming it, i.e. which were written and fed to `hasher`.
+    """
+    if hasher is None or not hasher.size:
+        return 0
+    try:
+        on_disk = os.path.getsize(download_filename)
+    except OSError:
+        return 0
+    return hasher.size if on_disk >= hasher.size else 0
+
+
+def _range_honoured(offset: int, status_code: int, headers) -> bool:
+    """Whether a response to a `Range: bytes=<offset>-` request continues at
+    `offset` rather than delivering the whole file or an error."""
+    content_range = headers.get("Content-Range", "")
+    return status_code == 206 and content_range.startswith("bytes %d-" % offset)
+
+
+class _BandwidthLimiter:
+    """Token bucket limiting the rate of the downloads sharing it to `rate`
+    bytes per second, on average over `burst` seconds.
+
+    `reserve` accounts for data and returns how long the caller has to wait
+    before receiving more, so that it can be used with `time.sleep` as well as
+    `asyncio.sleep`.
+    """
+
+    def __init__(self, rate, burst=1.0):
+        self.rate = rate
+        self.burst = burst
+        self._lock = threading.Lock()
+        # the bucket starts out full
+        self._available_at = time.monotonic() - burst
+
+    def reserve(self, nbytes):
+        """Account for `nbytes` received and return the delay in seconds."""
+        with self._lock:
+            now = time.monotonic()
+            # unused bandwidth only accumulates up to `burst` seconds
+            start = max(self._available_at, now - self.burst)
+            self._available_at = start + nbytes / self.rate
+            return max(0.0, self._available_at - now)
+
+    def throttle(self, nbytes):
+        """Account for `nbytes` received and block until more may follow."""
+        delay = self.reserve(nbytes)
+        if delay:
+            time.sleep(delay)
+
+
+def _download(
+    url,
+    target_directory,
+    session: requests.Session,
     *,
     proxies=None,
     ssl_verify=None,
     chunk_size: int = DEFAULT_CHUNK_SIZE,
     show_progress=False,
+    hasher: PackageHasher = None,
+    limiter: _BandwidthLimiter = None,
 ):
     """Download `url` to `target_directory`
 
@@ -684,6 +2046,12 @@ def _download(
         Path to a CA_BUNDLE file or directory with certificates of trusted CAs
     show_progress: bool
         Whether to display progress bars.
+    hasher: PackageHasher, optional
+        If given, it is fed every chunk as it is written. If it has already
+        seen the beginning of the file from an interrupted attempt, the
+        download is resumed with a HTTP Range request.
+    limiter: _BandwidthLimiter, optional
+        If given, the download is throttled to its rate.
 
     Returns
     -------
@@ -696,25 +2064,49 @@ def _download(
     target_filename = url.split("/")[-1]
     download_filename = os.path.join(target_directory, target_filename)
     logger.debug("downloading to %s", download_filename)
-    with open(download_filename, "w+b") as tf:
-        ret = session.get(url, stream=True, proxies=proxies, verify=ssl_verify)
-        size = int(ret.headers.get("Content-Length", 0))
+    offset = _resume_offset(download_filename, hasher)
+    headers = {"Range": "bytes=%d-" % offset} if offset else None
+    ret = session.get(
+        url, stream=True, proxies=proxies, verify=ssl_verify, headers=headers
+    )
+    if offset and not _range_honoured(offset, ret.status_code, ret.headers):
+        logger.debug("%s does not support resuming, restarting download", url)
+        offset = 0
+    if not offset and hasher is not None:
+        hasher.reset()
+    with open(download_filename, "r+b" if offset else "w+b") as tf:
+        # drop anything written after the last chunk which reached the hasher
+        tf.seek(offset)
+        tf.truncate()
+        size = offset + int(ret.headers.get("Content-Length", 0))
         progress = tqdm(
             desc=target_filename,
             disable=(size < 1024) or not show_progress,
             total=size,
+            initial=offset,
             leave=False,
             unit="byte",
             unit_scale=True,
         )
         for data in ret.iter_content(chunk_size):
             tf.write(data)
+            if hasher is not None:
+                hasher.update(data)
             progress.update(len(data))
+            if limiter is not None:
+                limiter.throttle(len(data))
         progress.close()
         file_size = os.path.getsize(download_filename)
     return file_size
 
 
+def _backoff_delay(attempt: int) -> float:
+    """Randomized exponential backoff delay in seconds before retrying after
+    the `attempt`-th failed download attempt."""
+    delay = 5.12e-5  # 51.2 us
+    return delay * random.randint(0, 2**attempt - 1)
+
+
 def _download_backoff_retry(
     url,
     target_directory,
@@ -725,6 +2117,8 @@ def _download_backoff_retry(
     chunk_size: int = DEFAULT_CHUNK_SIZE,
     max_retries: int = 100,
     show_progress=True,
+    hasher: PackageHasher = None,
+    limiter: _BandwidthLimiter = None,
 ):
     """Download `url` to `target_directory` with exponential backoff in the
     event of failure.
@@ -748,18 +2142,22 @@ def _download_backoff_retry(
         default 100.
     show_progress: bool
         Whether to display progress bars.
+    hasher: PackageHasher, optional
+        Fed the downloaded data. It carries the progress of interrupted
+        attempts so that they can be resumed rather than restarted.
+    limiter: _BandwidthLimiter, optional
+        If given, the download is throttled to its rate.
 
     Returns
     -------
     file_size: int
         The size in bytes of the file that was downloaded
     """
+    if hasher is None:
+        hasher = PackageHasher()
     c = 0
-    two_c = 1
-    delay = 5.12e-5  # 51.2 us
     while c < max_retries:
         c += 1
-        two_c *= 2
         try:
             rtn = _download(
                 url,
@@ -769,6 +2167,8 @@ def _download_backoff_retry(
                 ssl_verify=ssl_verify,
                 chunk_size=chunk_size,
                 show_progress=show_progress,
+                hasher=hasher,
+                limiter=limiter,
             )
             break
         except Exception:
@@ -776,10 +2176,491 @@ def _download_backoff_retry(
                 logger.debug(
                     "downloading failed, retrying {0}/{1}".format(c, max_retries)
                 )
-                time.sleep(delay * random.randint(0, two_c - 1))
-            else:
-                raise
-    return rtn
+                time.sleep(_backoff_delay(c))
+            else:
+                raise
+    return rtn
+
+
+def _make_session(pool_size: int = 1) -> requests.Session:
+    """Create a HTTP session whose connection pool is large enough to serve
+    `pool_size` concurrent downloads.
+
+    Parameters
+    ----------
+    pool_size : int
+        Maximum number of connections kept open per host.
+
+    Returns
+    -------
+    session : requests.Session
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def _download_and_check(
+    url,
+    target_directory,
+    session,
+    pkg_info=None,
+    hash_policy=DEFAULT_HASH_POLICY,
+    **kwargs,
+):
+    """Download `url` with `_download_backoff_retry` while verifying it against
+    its repodata entry `pkg_info` according to `hash_policy`.
+
+    Returns
+    -------
+    file_size : int
+        The size in bytes of the file that was downloaded
+    result : tuple or None
+        See `_check_download`.
+    """
+    hasher = PackageHasher(pkg_info, hash_policy)
+    file_size = _download_backoff_retry(
+        url, target_directory, session, hasher=hasher, **kwargs
+    )
+    download_filename = os.path.join(target_directory, url.split("/")[-1])
+    return file_size, _check_download(download_filename, hasher)
+
+
+def _download_packages(
+    downloads: Dict[str, Dict[str, Any]],
+    download_dir: str,
+    local_directory: str,
+    session: requests.Session,
+    *,
+    download_workers: int = 1,
+    minimum_free_space: int = 0,
+    proxies=None,
+    ssl_verify=None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    max_retries: int = 100,
+    show_progress: bool = True,
+    desc: str = None,
+    hash_policy: str = DEFAULT_HASH_POLICY,
+    executor: ThreadPoolExecutor = None,
+    limiter: _BandwidthLimiter = None,
+) -> Tuple[Set[str], List[Tuple[str, Optional[str]]]]:
+    """Download packages to `download_dir` using up to `download_workers`
+    concurrent downloads.
+
+    Every package is verified against its repodata entry while it is being
+    downloaded. Packages failing that check are removed.
+
+    Downloading stops being scheduled as soon as one download fails or the
+    free disk space in `download_dir` or `local_directory` drops below
+    `minimum_free_space`. Downloads which are already in flight at that point
+    are allowed to finish.
+
+    Parameters
+    ----------
+    downloads : dict
+        Mapping of the urls to download to the repodata entries of the packages
+    download_dir : str
+        The path to a directory where the packages should be downloaded
+    local_directory : str
+        The path to the directory the packages will be moved to afterwards
+    session : requests.Session
+        HTTP session instance shared by all downloads.
+    download_workers : int
+        Maximum number of concurrent downloads. Defaults to 1.
+    minimum_free_space : int
+        Free space threshold in bytes for `download_dir` and `local_directory`.
+    proxies : dict
+        Proxys for connecting internet
+    ssl_verify : str or bool
+        Path to a CA_BUNDLE file or directory with certificates of trusted CAs
+    chunk_size : int
+        Size of contiguous chunk to download in bytes.
+    max_retries : int
+        The maximum number of times to retry before the download error is reraised.
+    show_progress : bool
+        Whether to display progress bars.
+    desc : str
+        Description of the overall progress bar.
+    hash_policy : {'md5', 'sha256', 'prefer-sha256', 'all'}
+        Which digests to verify the packages against, see `_expected_digests`.
+    executor : concurrent.futures.ThreadPoolExecutor, optional
+        Executor to run the downloads in, e.g. one shared with the downloads
+        of other platforms. By default a new one with `download_workers`
+        threads is used. At most `download_workers` downloads are submitted to
+        it at a time, so that downloads sharing it take turns.
+    limiter : _BandwidthLimiter, optional
+        If given, the downloads are throttled to its rate.
+
+    Returns
+    -------
+    downloaded : set
+        The urls which were downloaded successfully.
+    validation_results : list
+        Twoples of (pkg_path, reason) for the packages which could be verified
+        while downloading, see `_check_download`.
+    """
+    download_workers = max(1, download_workers)
+    downloaded: Set[str] = set()
+    validation_results = []
+    total_bytes = 0
+    progress = tqdm(
+        total=len(downloads),
+        desc=desc,
+        unit="package",
+        leave=False,
+        disable=not show_progress,
+    )
+    pending = {}
+    remaining = iter(downloads)
+    aborted = False
+    if executor is None:
+        executor_context = ThreadPoolExecutor(max_workers=download_workers)
+    else:
+        executor_context = contextlib.nullcontext(executor)
+    with executor_context as executor:
+        while True:
+            while not aborted and len(pending) < download_workers:
+                url = next(remaining, None)
+                if url is None:
+                    break
+                # make sure we have enough free disk space in the temp folder to meet threshold
+                if shutil.disk_usage(download_dir).free < minimum_free_space:
+                    logger.error(
+                        "Disk space below threshold in %s. Aborting download.",
+                        download_dir,
+                    )
+                    aborted = True
+                    break
+                future = executor.submit(
+                    _download_and_check,
+                    url,
+                    download_dir,
+                    session,
+                    downloads[url],
+                    hash_policy,
+                    proxies=proxies,
+                    ssl_verify=ssl_verify,
+                    chunk_size=chunk_size,
+                    max_retries=max_retries,
+                    # per-file progress bars only make sense for serial downloads
+                    show_progress=show_progress and download_workers == 1,
+                    limiter=limiter,
+                )
+                pending[future] = url
+            if not pending:
+                break
+
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                url = pending.pop(future)
+                progress.update(1)
+                try:
+                    file_size, result = future.result()
+                except Exception as ex:
+                    logger.exception("Unexpected error: %s. Aborting download.", ex)
+                    aborted = True
+                    continue
+                total_bytes += file_size
+                if result is not None:
+                    validation_results.append(result)
+
+                # make sure we have enough free disk space in the target folder to meet threshold
+                # while also being able to fit the packages we have already downloaded
+                if (
+                    shutil.disk_usage(local_directory).free - total_bytes
+                ) < minimum_free_space:
+                    logger.error(
+                        "Disk space below threshold in %s. Aborting download",
+                        local_directory,
+                    )
+                    aborted = True
+                    continue
+
+                downloaded.add(url)
+    progress.close()
+    return downloaded, validation_results
+
+
+def _aiohttp_proxy(url, proxies=None):
+    """Pick the proxy url for `url` out of a requests-style `proxies` dict."""
+    if not proxies:
+        return None
+    scheme = url.split("://", 1)[0]
+    return proxies.get(scheme) or proxies.get("all")
+
+
+def _aiohttp_ssl(ssl_verify=None):
+    """Translate a requests-style `ssl_verify` value into the `ssl` argument
+    understood by aiohttp."""
+    if ssl_verify is None or ssl_verify is True:
+        return True
+    if ssl_verify is False:
+        return False
+    if os.path.isdir(ssl_verify):
+        return ssl.create_default_context(capath=ssl_verify)
+    return ssl.create_default_context(cafile=ssl_verify)
+
+
+async def _download_async(
+    url,
+    target_directory,
+    session,
+    *,
+    proxies=None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    show_progress=False,
+    hasher: PackageHasher = None,
+    limiter: _BandwidthLimiter = None,
+):
+    """Download `url` to `target_directory` using an aiohttp session.
+
+    This is the asyncio counterpart of `_download`. File writes are handed off
+    to the default executor so they do not block the event loop.
+
+    Parameters
+    ----------
+    url : str
+        The url to download
+    target_directory : str
+        The path to a directory where `url` should be downloaded
+    session : aiohttp.ClientSession
+        HTTP session instance.
+    proxies : dict
+        Proxys for connecting internet
+    chunk_size : int
+        Size of contiguous chunk to download in bytes.
+    show_progress: bool
+        Whether to display progress bars.
+    hasher: PackageHasher, optional
+        If given, it is fed every chunk as it is written and used to resume
+        interrupted downloads as in `_download`.
+    limiter: _BandwidthLimiter, optional
+        If given, the download is throttled to its rate.
+
+    Returns
+    -------
+    file_size: int
+        The size in bytes of the file that was downloaded
+    """
+    logger.info("download_url=%s", url)
+    loop = asyncio.get_running_loop()
+    target_filename = url.split("/")[-1]
+    download_filename = os.path.join(target_directory, target_filename)
+    logger.debug("downloading to %s", download_filename)
+    offset = _resume_offset(download_filename, hasher)
+    headers = {"Range": "bytes=%d-" % offset} if offset else None
+    async with session.get(
+        url, proxy=_aiohttp_proxy(url, proxies), headers=headers
+    ) as ret:
+        if offset and not _range_honoured(offset, ret.status, ret.headers):
+            logger.debug("%s does not support resuming, restarting download", url)
+            offset = 0
+        if not offset and hasher is not None:
+            hasher.reset()
+        with open(download_filename, "r+b" if offset else "w+b") as tf:
+            # drop anything written after the last chunk which reached the hasher
+            tf.seek(offset)
+            tf.truncate()
+            size = offset + int(ret.headers.get("Content-Length", 0))
+            progress = tqdm(
+                desc=target_filename,
+                disable=(size < 1024) or not show_progress,
+                total=size,
+                initial=offset,
+                leave=False,
+                unit="byte",
+                unit_scale=True,
+            )
+            async for data in ret.content.iter_chunked(chunk_size):
+                await loop.run_in_executor(None, tf.write, data)
+                if hasher is not None:
+                    hasher.update(data)
+                progress.update(len(data))
+                if limiter is not None:
+                    await asyncio.sleep(limiter.reserve(len(data)))
+            progress.close()
+    return os.path.getsize(download_filename)
+
+
+async def _download_backoff_retry_async(
+    url,
+    target_directory,
+    session,
+    *,
+    proxies=None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    max_retries: int = 100,
+    show_progress=True,
+    hasher: PackageHasher = None,
+    limiter: _BandwidthLimiter = None,
+):
+    """Download `url` to `target_directory` with the same exponential backoff
+    policy as `_download_backoff_retry`.
+
+    Returns
+    -------
+    file_size: int
+        The size in bytes of the file that was downloaded
+    """
+    if hasher is None:
+        hasher = PackageHasher()
+    c = 0
+    while c < max_retries:
+        c += 1
+        try:
+            rtn = await _download_async(
+                url,
+                target_directory,
+                session,
+                proxies=proxies,
+                chunk_size=chunk_size,
+                show_progress=show_progress,
+                hasher=hasher,
+                limiter=limiter,
+            )
+            break
+        except Exception:
+            if c < max_retries:
+                logger.debug(
+                    "downloading failed, retrying {0}/{1}".format(c, max_retries)
+                )
+                await asyncio.sleep(_backoff_delay(c))
+            else:
+                raise
+    return rtn
+
+
+async def _download_packages_async(
+    downloads: Dict[str, Dict[str, Any]],
+    download_dir: str,
+    local_directory: str,
+    *,
+    download_workers: int = 1,
+    connections_per_host: int = 0,
+    minimum_free_space: int = 0,
+    proxies=None,
+    ssl_verify=None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    max_retries: int = 100,
+    show_progress: bool = True,
+    desc: str = None,
+    hash_policy: str = DEFAULT_HASH_POLICY,
+    shared_semaphore: asyncio.Semaphore = None,
+    limiter: _BandwidthLimiter = None,
+) -> Tuple[Set[str], List[Tuple[str, Optional[str]]]]:
+    """Download packages to `download_dir` with asyncio, keeping at most
+    `download_workers` requests in flight.
+
+    Free space checks, verification and abort semantics are the same as for
+    `_download_packages`.
+
+    Parameters
+    ----------
+    connections_per_host : int
+        Maximum number of simultaneous connections to a single host. `0`
+        means no limit other than `download_workers`.
+    shared_semaphore : asyncio.Semaphore, optional
+        Semaphore additionally bounding the requests in flight, e.g. one
+        shared with the downloads of other platforms and channels. At most
+        `download_workers` downloads wait for it at a time, so that those
+        sharing it take turns.
+
+    See `_download_packages` for the remaining parameters.
+
+    Returns
+    -------
+    downloaded : set
+        The urls which were downloaded successfully.
+    validation_results : list
+        Twoples of (pkg_path, reason) for the packages which could be verified
+        while downloading, see `_check_download`.
+    """
+    download_workers = max(1, download_workers)
+    downloaded: Set[str] = set()
+    validation_results = []
+    total_bytes = 0
+    aborted = False
+    semaphore = asyncio.Semaphore(download_workers)
+    progress = tqdm(
+        total=len(downloads),
+        desc=desc,
+        unit="package",
+        leave=False,
+        disable=not show_progress,
+    )
+    connector = aiohttp.TCPConnector(
+        limit=download_workers,
+        limit_per_host=connections_per_host,
+        ssl=_aiohttp_ssl(ssl_verify),
+    )
+    # like requests, do not time out long downloads of large packages
+    timeout = aiohttp.ClientTimeout(total=None)
+
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+
+        async def fetch(url):
+            async with semaphore:
+                if shared_semaphore is None:
+                    await download(url)
+                else:
+                    async with shared_semaphore:
+                        await download(url)
+
+        async def download(url):
+            nonlocal aborted, total_bytes
+            if aborted:
+                return
+            # make sure we have enough free disk space in the temp folder to meet threshold
+            if shutil.disk_usage(download_dir).free < minimum_free_space:
+                logger.error(
+                    "Disk space below threshold in %s. Aborting download.",
+                    download_dir,
+                )
+                aborted = True
+                return
+            hasher = PackageHasher(downloads[url], hash_policy)
+            try:
+                total_bytes += await _download_backoff_retry_async(
+                    url,
+                    download_dir,
+                    session,
+                    proxies=proxies,
+                    chunk_size=chunk_size,
+                    max_retries=max_retries,
+                    show_progress=show_progress and download_workers == 1,
+                    hasher=hasher,
+                    limiter=limiter,
+                )
+            except Exception as ex:
+                logger.exception("Unexpected error: %s. Aborting download.", ex)
+                aborted = True
+                return
+            finally:
+                progress.update(1)
+            download_filename = os.path.join(download_dir, url.split("/")[-1])
+            result = _check_download(download_filename, hasher)
+            if result is not None:
+                validation_results.append(result)
+
+            # make sure we have enough free disk space in the target folder to meet threshold
+            # while also being able to fit the packages we have already downloaded
+            if (
+                shutil.disk_usage(local_directory).free - total_bytes
+            ) < minimum_free_space:
+                logger.error(
+                    "Disk space below threshold in %s. Aborting download",
+                    local_directory,
+                )
+                aborted = True
+                return
+
+            downloaded.add(url)
+
+        await asyncio.gather(*(fetch(url) for url in downloads))
+    progress.close()
+    return downloaded, validation_results
 
 
 def _list_conda_packages(local_dir):
@@ -804,7 +2685,128 @@ def _list_conda_packages(local_dir):
     return results
 
 
-def _validate_packages(package_repodata, package_directory, num_threads=1):
+class ValidationCache:
+    """Persistent record of the packages in a directory which passed validation.
+
+    For each package the cache stores the size, mtime and inode of the file
+    when it was validated, the md5 and sha256 from the repodata, which of
+    them were verified under `hash_policy` and when that happened. A package
+    is trusted as long as neither the file nor its hashes in the repodata
+    changed, the digests verified then include those `hash_policy` verifies
+    now and, if `max_age` (in days) is given, it was validated recently
+    enough.
+
+    The cache is the SQLite database `VALIDATION_CACHE_FILENAME` in
+    `cache_directory`, which is kept apart from the packages so that it is
+    not published with the mirror.
+    """
+
+    def __init__(
+        self,
+        package_directory,
+        cache_directory,
+        max_age=None,
+        hash_policy=DEFAULT_HASH_POLICY,
+    ):
+        self.package_directory = package_directory
+        self.cache_directory = cache_directory
+        self.path = os.path.join(cache_directory, VALIDATION_CACHE_FILENAME)
+        self.max_age = max_age
+        self.hash_policy = hash_policy
+        with self._connect() as conn:
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(validated)")]
+            if columns and "algorithms" not in columns:
+                # written before the verified digests were recorded
+                conn.execute("DROP TABLE validated")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS validated ("
+                "filename TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, "
+                "inode INTEGER, md5 TEXT, sha256 TEXT, algorithms TEXT, "
+                "verified_at REAL)"
+            )
+
+    def _algorithms(self, md5, sha256) -> Set[str]:
+        """The digests `hash_policy` verifies for a package."""
+        return set(_expected_digests(self.hash_policy, md5=md5, sha256=sha256))
+
+    @contextlib.contextmanager
+    def _connect(self):
+        os.makedirs(self.cache_directory, exist_ok=True)
+        conn = sqlite3.connect(self.path)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _stat(self, package):
+        st = os.stat(os.path.join(self.package_directory, package))
+        return st.st_size, st.st_mtime_ns, st.st_ino
+
+    def trusted(self, package_repodata) -> Set[str]:
+        """Filenames of the packages which can be trusted without validating
+        them against `package_repodata` again."""
+        min_verified_at = None
+        if self.max_age is not None:
+            min_verified_at = time.time() - self.max_age * 24 * 60 * 60
+        trusted = set()
+        stale = []
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT filename, size, mtime_ns, inode, md5, sha256, algorithms, "
+                "verified_at FROM validated"
+            ).fetchall()
+            for row in rows:
+                package, size, mtime_ns, inode, md5, sha256, algorithms, verified_at = (
+                    row
+                )
+                try:
+                    stat = self._stat(package)
+                except OSError:
+                    stale.append((package,))
+                    continue
+                pkg_info = package_repodata.get(package)
+                if (
+                    pkg_info is not None
+                    and stat == (size, mtime_ns, inode)
+                    and (md5, sha256) == (pkg_info.get("md5"), pkg_info.get("sha256"))
+                    and self._algorithms(md5, sha256) <= set(algorithms.split(","))
+                    and (min_verified_at is None or verified_at >= min_verified_at)
+                ):
+                    trusted.add(package)
+            conn.executemany("DELETE FROM validated WHERE filename = ?", stale)
+        return trusted
+
+    def record(self, packages: Iterable[str], package_repodata):
+        """Remember that `packages` were just validated against
+        `package_repodata`."""
+        now = time.time()
+        rows = []
+        for package in packages:
+            pkg_info = package_repodata.get(package, {})
+            md5, sha256 = pkg_info.get("md5"), pkg_info.get("sha256")
+            algorithms = ",".join(sorted(self._algorithms(md5, sha256)))
+            rows.append(
+                (package,) + self._stat(package) + (md5, sha256, algorithms, now)
+            )
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO validated VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+
+
+def _validate_packages(
+    package_repodata,
+    package_directory,
+    num_threads=1,
+    trusted=(),
+    buffer_size=VALIDATION_BUFFER_SIZE,
+    executor="process",
+    hash_policy=DEFAULT_HASH_POLICY,
+    pool=None,
+    on_result=None,
+):
     """Validate local conda packages.
 
     NOTE1: This will remove any packages that are in `package_directory` that
@@ -823,30 +2825,68 @@ def _validate_packages(package_repodata, package_directory, num_threads=1):
         Number of concurrent processes to use. Set to `0` to use a number of
         processes equal to the number of cores in the system. Defaults to `1`
         (i.e. serial package validation).
+    trusted : iterable of str
+        Filenames of packages in `package_directory` which are already known
+        to be valid and are skipped.
+    buffer_size : int
+        Size in bytes of the chunks in which packages are read for hashing.
+    executor : {'process', 'thread'}
+        Whether concurrent validation uses a pool of processes or of threads.
+        Processes cost their start-up and pickling every task and result
+        between them and the parent. Threads avoid both and still hash in
+        parallel, since hashlib releases the GIL while hashing large buffers,
+        but opening and removing files happens under the GIL.
+    hash_policy : {'md5', 'sha256', 'prefer-sha256', 'all'}
+        Which digests from the repodata to verify, see `_expected_digests`.
+    pool : multiprocessing.pool.Pool, optional
+        Pool to validate the packages in, e.g. one shared with the validation
+        of other platforms. Takes precedence over `num_threads` and
+        `executor`.
+    on_result : callable, optional
+        Called with each (pkg_path, reason) twople as soon as the package is
+        validated. Concurrent validation yields them in completion order.
 
     Returns
     -------
     list
-        Iterable of twoples of (pkg_path, reason) where
+        Twoples of (pkg_path, reason) where
         pkg_path : str
             The full path to the package that is being removed
         reason : str
             The reason why the package is being removed
     """
     # validate local conda packages
-    local_packages = _list_conda_packages(package_directory)
+    trusted = set(trusted)
+    local_packages = [
+        package
+        for package in _list_conda_packages(package_directory)
+        if package not in trusted
+    ]
 
     # create argument list (necessary because multiprocessing.Pool.map does not
     # accept additional args to be passed to the mapped function)
     num_packages = len(local_packages)
+    # only ship the metadata needed to validate each package, so that the
+    # repodata is not pickled into every task of a process pool
     val_func_arg_list = [
-        (package, num, num_packages, package_repodata, package_directory)
+        (
+            package,
+            num,
+            num_packages,
+            _validation_metadata(package_repodata.get(package)),
+            package_directory,
+            buffer_size,
+            hash_policy,
+        )
         for num, package in enumerate(sorted(local_packages))
     ]
 
-    if num_threads == 1 or num_threads is None:
+    own_pool = None
+    if pool is not None:
+        results = pool.imap_unordered(_validate_or_remove_package, val_func_arg_list)
+    elif num_threads == 1 or num_threads is None:
         # Do serial package validation (Takes a long time for large repos)
-        validation_results = map(_validate_or_remove_package, val_func_arg_list)
+        results = map(_validate_or_remove_package, val_func_arg_list)
     else:
         if num_threads == 0:
             num_threads = os.cpu_count()
@@ -857,14 +2897,41 @@ def _validate_packages(package_repodata, package_directory, num_threads=1):
         logger.info(
             "Will use {} threads for package validation." "".format(num_threads)
         )
-        p = multiprocessing.Pool(num_threads)
-        validation_results = p.map(_validate_or_remove_package, val_func_arg_list)
-        p.close()
-        p.join()
+        if executor == "thread":
+            own_pool = ThreadPool(num_threads)
+        else:
+            own_pool = multiprocessing.Pool(num_threads)
+        results = own_pool.imap_unordered(
+            _validate_or_remove_package, val_func_arg_list
+        )
+
+    # handle every result as it arrives instead of waiting for all of them
+    validation_results = []
+    try:
+        for result in results:
+            validation_results.append(result)
+            if on_result is not None:
+                on_result(result)
+    except BaseException:
+        if own_pool is not None:
+            own_pool.terminate()
+        raise
+    finally:
+        if own_pool is not None:
+            own_pool.close()
+            own_pool.join()
 
     return validation_results
 
 
+def _validation_metadata(pkg_info):
+    """The (md5, size, sha256) of a package metadata dict, or None if there is
+    no metadata for the package."""
+    if pkg_info is None:
+        return None
+    return pkg_info.get("md5"), pkg_info.get("size"), pkg_info.get("sha256")
+
+
 def _validate_or_remove_package(args):
     """Validata or remove package.
 
@@ -874,8 +2941,11 @@ def _validate_or_remove_package(args):
         - `args[0]` is `package`.
         - `args[1]` is the number of the package in the list of all packages.
         - `args[2]` is the number of all packages.
-        - `args[3]` is `package_repodata`.
+        - `args[3]` is the (md5, size, sha256) of the package in the upstream
+          repodata, see `_validation_metadata`, or None if it is not in it.
         - `args[4]` is `package_directory`.
+        - `args[5]` is the `buffer_size` used for hashing.
+        - `args[6]` is the `hash_policy`, see `_expected_digests`.
 
     Returns
     -------
@@ -888,14 +2958,14 @@ def _validate_or_remove_package(args):
     package = args[0]
     num = args[1]
     num_packages = args[2]
-    package_repodata = args[3]
+    package_metadata = args[3]
     package_directory = args[4]
+    buffer_size = args[5]
+    hash_policy = args[6]
 
     # ensure the packages in this directory are in the upstream
     # repodata.json
-    try:
-        package_metadata = package_repodata[package]
-    except KeyError:
+    if package_metadata is None:
         log_msg = f"{package} is not in the upstream index. Removing..."
         if logger:
             logger.warning(log_msg)
@@ -916,11 +2986,23 @@ def _validate_or_remove_package(args):
         # TODO: Fix this properly with a logging Queue
         sys.stdout.write("Info: " + log_msg)
     package_path = os.path.join(package_directory, package)
+    md5, size, sha256 = package_metadata
     return _validate(
-        package_path, md5=package_metadata.get("md5"), size=package_metadata.get("size")
+        package_path,
+        md5=md5,
+        size=size,
+        buffer_size=buffer_size,
+        sha256=sha256,
+        hash_policy=hash_policy,
     )
 
 
+def _version_sort_key(version):
+    """Key sorting VersionOrder instances by native tuple comparisons, if they
+    provide a sort key (those of conda do not), or else by themselves."""
+    return getattr(version, "sort_key", version)
+
+
 def _find_non_recent_packages(
     packages: Dict[str, Dict[str, Any]],
     *,
@@ -965,7 +3047,7 @@ def _find_non_recent_packages(
 
         for curpackages in packages_by_name.values():
             curpackages.sort(
-                key=lambda x: x.version, reverse=True
+                key=lambda x: _version_sort_key(x.version), reverse=True
             )  # recent versions first
             dev_versions = [
                 p.package_file for p in curpackages if "DEV" in p.version.version[-1]
@@ -983,6 +3065,113 @@ def _find_non_recent_packages(
     return non_recent_packages
 
 
+def _split_platforms(platform):
+    """The list of platforms in `platform`, which is either a single platform,
+    a comma separated list of platforms or a list of platforms."""
+    if isinstance(platform, str):
+        platform = platform.split(",")
+    platforms = []
+    for p in platform:
+        p = p.strip()
+        if p and p not in platforms:
+            platforms.append(p)
+    return platforms
+
+
+def _new_summary():
+    """An empty summary of a mirror run, see `main`."""
+    return {
+        "validating-existing": set(),
+        "validating-new": set(),
+        "downloaded": set(),
+        "blacklisted": set(),
+        "to-mirror": set(),
+    }
+
+
+class _MirrorContext:
+    """Resources shared by the platforms and channels mirrored in one run of
+    `main` or `mirror_channels`.
+
+    These are the HTTP connection pool, the download workers, the bandwidth
+    limit and the validation pool, so that mirroring several platforms or
+    channels concurrently uses no more connections, downloads, bandwidth or
+    validation workers than mirroring one.
+
+    Downloads of the 'requests' backend run in a thread pool of
+    `download_workers` threads. Those of the 'asyncio' backend run on an event
+    loop in a separate thread, see `run`, and share a semaphore allowing
+    `download_workers` requests in flight. The validation pool is only created
+    for concurrent validation (`num_threads` other than 1), and before any
+    thread is started, so that a process pool is forked from a single
+    threaded process.
+    """
+
+    def __init__(
+        self,
+        download_workers=1,
+        download_backend="requests",
+        num_threads=1,
+        validation_executor="process",
+        max_bandwidth=None,
+    ):
+        download_workers = max(1, download_workers)
+        self.session = _make_session(download_workers)
+        self.limiter = None
+        if max_bandwidth:
+            self.limiter = _BandwidthLimiter(max_bandwidth * 1024 * 1024)
+        self.validation_pool = None
+        if not (num_threads == 1 or num_threads is None):
+            if num_threads == 0:
+                num_threads = os.cpu_count()
+            logger.info("Will use %s threads for package validation.", num_threads)
+            if validation_executor == "thread":
+                self.validation_pool = ThreadPool(num_threads)
+            else:
+                self.validation_pool = multiprocessing.Pool(num_threads)
+        self.download_executor = None
+        self.download_semaphore = None
+        self._loop = None
+        if download_backend == "asyncio":
+            self._loop = asyncio.new_event_loop()
+            self._loop_thread = threading.Thread(
+                target=self._loop.run_forever, daemon=True
+            )
+            self._loop_thread.start()
+            self.download_semaphore = self.run(_make_semaphore(download_workers))
+        else:
+            self.download_executor = ThreadPoolExecutor(max_workers=download_workers)
+
+    def run(self, coro):
+        """Run the coroutine `coro` on the event loop of the 'asyncio' backend
+        and return its result. Can be called from any thread."""
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    def close(self):
+        """Release the shared resources."""
+        if self.download_executor is not None:
+            self.download_executor.shutdown()
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._loop_thread.join()
+            self._loop.close()
+        if self.validation_pool is not None:
+            self.validation_pool.close()
+            self.validation_pool.join()
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+async def _make_semaphore(value):
+    """Create an `asyncio.Semaphore` on the running event loop."""
+    return asyncio.Semaphore(value)
+
+
 def main(
     upstream_channel,
     target_directory,
@@ -994,6 +3183,15 @@ def main(
     latest_non_dev: int = -1,
     latest_dev: int = -1,
     num_threads=1,
+    download_workers: int = 1,
+    download_backend: str = "requests",
+    connections_per_host: int = 0,
+    repodata_cache_dir=None,
+    use_jlap=False,
+    stream_repodata=False,
+    validation_cache=False,
+    validation_cache_max_age=None,
+    validation_cache_dir=None,
     dry_run=False,
     no_validate_target=False,
     minimum_free_space=0,
@@ -1002,6 +3200,10 @@ def main(
     chunk_size: int = DEFAULT_CHUNK_SIZE,
     max_retries=100,
     show_progress: bool = True,
+    validation_buffer_size: int = VALIDATION_BUFFER_SIZE,
+    validation_executor: str = "process",
+    hash_policy: str = DEFAULT_HASH_POLICY,
+    max_bandwidth: float = None,
 ):
     """
 
@@ -1019,10 +3221,12 @@ def main(
         The path on disk to an existing and writable directory to temporarily
         store the packages before moving them to the target_directory to
         apply checks
-    platform : str
+    platform : str or list of str
         The platform that you wish to mirror for. Common options are
         'linux-64', 'osx-64', 'win-64', 'win-32' and 'noarch'. Any platform is valid as
-        long as the url resolves.
+        long as the url resolves. Several platforms, given as a list or a comma
+        separated string, are mirrored concurrently and share the connection
+        pool, the `download_workers` and the validation workers.
     blacklist : iterable of tuples, optional
         The values of blacklist should be (key, glob) where key is one of the
         keys in the repodata['packages'] dicts and glob is a thing to match
@@ -1033,7 +3237,8 @@ def main(
         on.  Note that all comparisons will be laundered through lowercasing.
     include_depends: bool
         If true, then include packages matching dependencies of whitelisted
-        packages as well.
+        packages as well. If noarch is mirrored together with other platforms,
+        dependencies are looked up across each platform and noarch.
     latest_dev: int
         If >= zero, then only that number of the most recent development versions of
         each package in a repo subdir will be downloaded.
@@ -1044,6 +3249,43 @@ def main(
         Number of threads to be used for concurrent validation.  Defaults to
         `num_threads=1` for non-concurrent mode.  To use all available cores,
         set `num_threads=0`.
+    download_workers : int, optional
+        Number of packages to download concurrently over a shared connection
+        pool. Defaults to `download_workers=1` for serial downloads.
+    download_backend : {'requests', 'asyncio'}, optional
+        The download implementation. 'requests' (the default) uses a thread
+        pool; 'asyncio' uses aiohttp and keeps `download_workers` requests in
+        flight from a single thread. The latter requires aiohttp.
+    connections_per_host : int, optional
+        Maximum number of simultaneous connections per host for the 'asyncio'
+        backend. `0` (the default) means no limit other than `download_workers`.
+    repodata_cache_dir : str, optional
+        Directory in which to cache the upstream repodata between runs. It is
+        then only downloaded again if it changed upstream, and if neither the
+        repodata nor the configuration changed since the last complete run,
+        the run is skipped altogether.
+    use_jlap : bool, optional
+        Update the cached repodata from the channel's repodata.jlap patches
+        instead of downloading it in full whenever it changed. Requires
+        `repodata_cache_dir`.
+    stream_repodata : bool, optional
+        Parse the upstream repodata incrementally and only keep the metadata
+        of packages which are not blacklisted or are already in the mirror,
+        so that memory usage scales with the mirrored subset of the channel.
+        Has no effect together with `include_depends`, which needs the
+        metadata of all packages.
+    validation_cache : bool, optional
+        Remember which packages in the mirror passed validation in a small
+        database, see `ValidationCache`. Unchanged packages are then not
+        validated again on later runs.
+    validation_cache_max_age : float, optional
+        Validate packages again once their last validation is older than this
+        many days. `0` forces a full validation. Defaults to no limit.
+    validation_cache_dir : str, optional
+        Directory in which to keep the validation cache, in a subdirectory per
+        channel and platform. Defaults to `repodata_cache_dir` if given, else
+        to a 'validation-cache' directory in `temp_directory`. The cache is
+        never kept in `target_directory`, which is published.
     dry_run : bool, optional
         Defaults to False.
         If True, skip validation and exit after determining what needs to be
@@ -1064,6 +3306,21 @@ def main(
         default 100.
     show_progress: bool
         Show progress bar while downloading. True by default.
+    validation_buffer_size : int
+        Size in bytes of the chunks in which packages are read for hashing
+        during validation. Memory usage of each validation worker is bounded
+        by it. Default is 1MB.
+    validation_executor : {'process', 'thread'}
+        Whether concurrent validation (`num_threads` other than 1) uses a pool
+        of processes (the default) or of threads.
+    hash_policy : {'md5', 'sha256', 'prefer-sha256', 'all'}
+        Which digests from the repodata packages are verified against, both
+        while downloading and when validating. 'prefer-sha256' (the default)
+        verifies the sha256 if the repodata provides one and the md5
+        otherwise, 'all' verifies every digest the repodata provides.
+    max_bandwidth : float, optional
+        Limit the total download rate of packages to this many megabytes per
+        second. Defaults to no limit.
 
     Returns
     -------
@@ -1103,59 +3360,559 @@ def main(
      'size': 1960193,
      'version': '8.5.18'}
     """
-    # TODO update these comments. They are no longer totally correct.
+    options = dict(
+        blacklist=blacklist,
+        whitelist=whitelist,
+        include_depends=include_depends,
+        latest_non_dev=latest_non_dev,
+        latest_dev=latest_dev,
+        num_threads=num_threads,
+        download_workers=download_workers,
+        download_backend=download_backend,
+        connections_per_host=connections_per_host,
+        repodata_cache_dir=repodata_cache_dir,
+        use_jlap=use_jlap,
+        stream_repodata=stream_repodata,
+        validation_cache=validation_cache,
+        validation_cache_max_age=validation_cache_max_age,
+        validation_cache_dir=validation_cache_dir,
+        dry_run=dry_run,
+        no_validate_target=no_validate_target,
+        minimum_free_space=minimum_free_space,
+        proxies=proxies,
+        ssl_verify=ssl_verify,
+        chunk_size=chunk_size,
+        max_retries=max_retries,
+        show_progress=show_progress,
+        validation_buffer_size=validation_buffer_size,
+        validation_executor=validation_executor,
+        hash_policy=hash_policy,
+    )
+    _check_options(**options)
+    platforms = _split_platforms(platform)
+    if not platforms:
+        raise ValueError("No platform to mirror")
+
+    with _make_context(max_bandwidth=max_bandwidth, **options) as context:
+        return _mirror_channel(
+            context,
+            upstream_channel,
+            target_directory,
+            temp_directory,
+            platforms,
+            **options,
+        )
+
+
+def mirror_channels(
+    channels,
+    target_directory,
+    temp_directory,
+    platform=None,
+    blacklist=None,
+    whitelist=None,
+    include_depends=False,
+    max_bandwidth: float = None,
+    **kwargs,
+):
+    """Mirror several upstream channels concurrently in one run.
+
+    All channels share the connection pool, the `download_workers`, the
+    `max_bandwidth` and the validation workers, see `main`. Each channel and
+    platform queues at most `download_workers` packages for those at a time,
+    so that one large channel does not keep the others waiting.
+
+    Parameters
+    ----------
+    channels : list
+        The channels to mirror. Each is either an upstream channel as for
+        `main` or a dict with the key 'upstream_channel' and optionally any of
+        `CHANNEL_OPTIONS`, which then replace the arguments of the same name
+        for that channel.
+    target_directory : str
+        The directory containing the mirrors of the channels. Each channel is
+        mirrored into the subdirectory named after it, unless it has a
+        'target_directory' of its own, which is relative to this one.
+    temp_directory : str
+        See `main`.
+    platform : str or list of str, optional
+        The platforms to mirror of the channels which do not list their own.
+    blacklist, whitelist, include_depends : optional
+        The filters of the channels which do not have their own, see `main`.
+    max_bandwidth : float, optional
+        See `main`.
+    **kwargs
+        Further arguments of `main`, applied to all channels.
+
+    Returns
+    -------
+    dict
+        The summary of each channel, see `main`, keyed by upstream channel.
+    """
+    _check_options(**kwargs)
+    jobs = _channel_jobs(
+        channels,
+        target_directory,
+        platform=platform,
+        blacklist=blacklist,
+        whitelist=whitelist,
+        include_depends=include_depends,
+    )
+    with _make_context(max_bandwidth=max_bandwidth, **kwargs) as context:
+        return _mirror_jobs(context, jobs, temp_directory, **kwargs)
+
+
+def _channel_jobs(
+    channels,
+    target_directory,
+    platform=None,
+    blacklist=None,
+    whitelist=None,
+    include_depends=False,
+):
+    """The (upstream channel, target directory, platforms, options) of each of
+    the `channels` of `mirror_channels`, which are checked for conflicts."""
+    defaults = dict(
+        platform=platform,
+        blacklist=blacklist,
+        whitelist=whitelist,
+        include_depends=include_depends,
+    )
+    jobs = []
+    targets = set()
+    for channel in channels:
+        if isinstance(channel, str):
+            channel = {"upstream_channel": channel}
+        upstream_channel = channel.get("upstream_channel")
+        if not upstream_channel:
+            raise ValueError("Missing upstream_channel of channel %s" % channel)
+        unknown = set(channel) - {"upstream_channel"} - set(CHANNEL_OPTIONS)
+        if unknown:
+            raise ValueError(
+                "Unknown options of channel %s: %s"
+                % (upstream_channel, ", ".join(sorted(unknown)))
+            )
+        if any(upstream_channel == job[0] for job in jobs):
+            raise ValueError("Channel %s is listed more than once" % upstream_channel)
+        _, channel_name = _maybe_split_channel(upstream_channel)
+        options = dict(defaults)
+        options.update(channel)
+        del options["upstream_channel"]
+        target = os.path.join(
+            target_directory, options.pop("target_directory", channel_name)
+        )
+        if os.path.abspath(target) in targets:
+            raise ValueError("Several channels are mirrored to %s" % target)
+        targets.add(os.path.abspath(target))
+        platforms = _split_platforms(options.pop("platform") or [])
+        if not platforms:
+            raise ValueError("No platform to mirror of channel %s" % upstream_channel)
+        jobs.append((upstream_channel, target, platforms, options))
+    return jobs
+
+
+def _mirror_jobs(context, jobs, temp_directory, **kwargs):
+    """Mirror the channels of `jobs`, see `_channel_jobs`, concurrently using
+    the resources shared through `context` and return their summaries keyed
+    by upstream channel."""
+
+    def _mirror(upstream_channel, target, platforms, options):
+        logger.info("Mirroring %s to %s", upstream_channel, target)
+        try:
+            return _mirror_channel(
+                context,
+                upstream_channel,
+                target,
+                temp_directory,
+                platforms,
+                **options,
+                **kwargs,
+            )
+        except Exception:
+            logger.exception("Mirroring %s failed", upstream_channel)
+            raise
+
+    summaries = _run_concurrently(_mirror, jobs)
+    return {job[0]: summary for job, summary in zip(jobs, summaries)}
+
+
+def watch(
+    interval: float,
+    target_directory,
+    temp_directory,
+    upstream_channel=None,
+    platform=None,
+    channels=None,
+    blacklist=None,
+    whitelist=None,
+    include_depends=False,
+    max_bandwidth: float = None,
+    repodata_cache_dir=None,
+    max_cycles: int = None,
+    **kwargs,
+):
+    """Mirror like `main`, or like `mirror_channels` if `channels` are given,
+    every `interval` seconds until interrupted.
+
+    Unlike running those repeatedly, e.g. from cron, the connection pool, the
+    download workers and the validation pool are created once and kept for
+    all cycles, as are the caches of parsed versions and version specs. Each
+    cycle polls the upstream repodata with conditional requests through the
+    repodata cache (a temporary one unless `repodata_cache_dir` is given), so
+    a platform whose repodata did not change is skipped without parsing it,
+    and otherwise only new packages are downloaded and packages gone from the
+    channel or the filters are removed. Packages in the mirror are only
+    validated again when they change, see `ValidationCache`, whose database is
+    kept in `validation_cache_dir` if given, or else with the cached repodata.
+
+    An error only fails its cycle: it is logged and the next cycle starts as
+    scheduled.
+
+    Parameters
+    ----------
+    interval : float
+        The number of seconds between the starts of consecutive cycles. A
+        cycle which takes longer is immediately followed by the next one.
+    target_directory, temp_directory, upstream_channel, platform :
+        See `main`, or `mirror_channels` if `channels` are given, in which
+        case `upstream_channel` must not be.
+    channels : list, optional
+        See `mirror_channels`.
+    blacklist, whitelist, include_depends, max_bandwidth, repodata_cache_dir :
+        See `main`.
+    max_cycles : int, optional
+        Stop after this many cycles. Defaults to no limit.
+    **kwargs
+        Further arguments of `main`.
+    """
+    if channels:
+        if upstream_channel:
+            raise ValueError("upstream_channel cannot be combined with channels")
+        jobs = _channel_jobs(
+            channels,
+            target_directory,
+            platform=platform,
+            blacklist=blacklist,
+            whitelist=whitelist,
+            include_depends=include_depends,
+        )
+    else:
+        platforms = _split_platforms(platform)
+        if not platforms:
+            raise ValueError("No platform to mirror")
+        filters = dict(
+            blacklist=blacklist, whitelist=whitelist, include_depends=include_depends
+        )
+        jobs = [(upstream_channel, target_directory, platforms, filters)]
+    kwargs["validation_cache"] = True
+
+    with contextlib.ExitStack() as stack:
+        if repodata_cache_dir is None:
+            repodata_cache_dir = stack.enter_context(
+                tempfile.TemporaryDirectory(prefix="conda-mirror-repodata-")
+            )
+        kwargs["repodata_cache_dir"] = repodata_cache_dir
+        _check_options(**kwargs)
+        context = stack.enter_context(
+            _make_context(max_bandwidth=max_bandwidth, **kwargs)
+        )
+        cycle = 0
+        while True:
+            cycle += 1
+            start = time.monotonic()
+            logger.info("Starting mirror cycle %d", cycle)
+            try:
+                summaries = _mirror_jobs(context, jobs, temp_directory, **kwargs)
+            except Exception:
+                # the error was logged by the channel which failed
+                logger.error("Mirror cycle %d failed", cycle)
+            else:
+                # packages which failed verification are downloaded again in
+                # the next cycle, see _mirror_platform
+                logger.info(
+                    "Mirror cycle %d downloaded %d packages (%d failed "
+                    "verification) in %.1fs",
+                    cycle,
+                    sum(len(s["downloaded"]) for s in summaries.values()),
+                    sum(
+                        reason is not None
+                        for s in summaries.values()
+                        for _, reason in s["validating-new"]
+                    ),
+                    time.monotonic() - start,
+                )
+            if version_cache_stats is not None:
+                logger.debug("Version caches: %s", version_cache_stats())
+            if max_cycles is not None and cycle >= max_cycles:
+                break
+            time.sleep(max(0, start + interval - time.monotonic()))
+
+
+def _check_options(
+    download_backend="requests",
+    validation_executor="process",
+    hash_policy=DEFAULT_HASH_POLICY,
+    use_jlap=False,
+    repodata_cache_dir=None,
+    **options,
+):
+    """Raise if the options of `main` are invalid or cannot be used."""
+    if download_backend not in DOWNLOAD_BACKENDS:
+        raise ValueError("Unknown download backend: %s" % download_backend)
+    if download_backend == "asyncio" and aiohttp is None:
+        raise ImportError("The asyncio download backend requires aiohttp")
+    if validation_executor not in VALIDATION_EXECUTORS:
+        raise ValueError("Unknown validation executor: %s" % validation_executor)
+    if hash_policy not in HASH_POLICIES:
+        raise ValueError("Unknown hash policy: %s" % hash_policy)
+    if use_jlap and not repodata_cache_dir:
+        raise ValueError("use_jlap requires a repodata_cache_dir")
+
+
+def _make_context(
+    download_workers=1,
+    download_backend="requests",
+    num_threads=1,
+    validation_executor="process",
+    dry_run=False,
+    max_bandwidth=None,
+    **options,
+):
+    """The `_MirrorContext` for the options of `main`."""
+    return _MirrorContext(
+        download_workers=download_workers,
+        download_backend=download_backend,
+        # dry runs do not validate
+        num_threads=1 if dry_run else num_threads,
+        validation_executor=validation_executor,
+        max_bandwidth=max_bandwidth,
+    )
+
+
+def _run_concurrently(func, args_list):
+    """Call `func` with each of the tuples of arguments in `args_list` in a
+    thread of its own and return the results in the same order.
+
+    All calls are allowed to finish before the first error, if any, is
+    reraised.
+    """
+    if len(args_list) == 1:
+        return [func(*args_list[0])]
+    with ThreadPoolExecutor(max_workers=len(args_list)) as executor:
+        futures = [executor.submit(func, *args) for args in args_list]
+    return [future.result() for future in futures]
+
+
+def _mirror_channel(
+    context,
+    upstream_channel,
+    target_directory,
+    temp_directory,
+    platforms,
+    **options,
+):
+    """Mirror the `platforms` of `upstream_channel` concurrently using the
+    resources shared through `context`.
+
+    See `main` for the parameters and the returned summary.
+    """
+    closure = None
+    if options.get("include_depends"):
+        if "noarch" not in platforms:
+            logger.warning(
+                "noarch is not mirrored, so dependencies of %s on noarch "
+                "packages are not included",
+                upstream_channel,
+            )
+        elif len(platforms) > 1:
+            closure = _SubdirClosure(platforms)
+
+    def _mirror(platform):
+        try:
+            return _mirror_platform(
+                context,
+                upstream_channel,
+                target_directory,
+                temp_directory,
+                platform,
+                closure=closure,
+                **options,
+            )
+        except threading.BrokenBarrierError:
+            # another platform failed, whose error is reraised instead
+            return _new_summary()
+        except Exception:
+            if closure is not None:
+                closure.abort()
+            raise
+
+    summary = _new_summary()
+    # the platforms share the download and validation workers of the context,
+    # so running them concurrently does not add to those
+    for platform_summary in _run_concurrently(_mirror, [(p,) for p in platforms]):
+        for key, value in platform_summary.items():
+            summary[key].update(value)
+
+    # Also need to make a "noarch" channel or conda gets mad
+    noarch_path = os.path.join(target_directory, "noarch")
+    if not (options.get("dry_run") or os.path.exists(noarch_path)):
+        os.makedirs(noarch_path, exist_ok=True)
+        noarch_repodata = {"info": {}, "packages": {}}
+        _write_repodata(noarch_path, noarch_repodata)
+
+    return summary
+
+
+def _mirror_platform(
+    context,
+    upstream_channel,
+    target_directory,
+    temp_directory,
+    platform,
+    *,
+    blacklist=None,
+    whitelist=None,
+    include_depends=False,
+    latest_non_dev: int = -1,
+    latest_dev: int = -1,
+    num_threads=1,
+    download_workers: int = 1,
+    download_backend: str = "requests",
+    connections_per_host: int = 0,
+    repodata_cache_dir=None,
+    use_jlap=False,
+    stream_repodata=False,
+    validation_cache=False,
+    validation_cache_max_age=None,
+    validation_cache_dir=None,
+    dry_run=False,
+    no_validate_target=False,
+    minimum_free_space=0,
+    proxies=None,
+    ssl_verify=None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    max_retries=100,
+    show_progress: bool = True,
+    validation_buffer_size: int = VALIDATION_BUFFER_SIZE,
+    validation_executor: str = "process",
+    hash_policy: str = DEFAULT_HASH_POLICY,
+    closure: _SubdirClosure = None,
+):
+    """Mirror a single platform of `upstream_channel` using the resources
+    shared through `context`, see `_MirrorContext`.
+
+    If `closure` is given, the dependencies of `include_depends` are resolved
+    together with the other platforms sharing it.
+
+    See `main` for the parameters and the returned summary.
+    """
     # Steps:
-    # 1. figure out blacklisted packages
-    # 2. un-blacklist packages that are actually whitelisted
-    # 3. remove blacklisted packages
-    # 4. figure out final list of packages to mirror
-    # 5. mirror new packages to temp dir
-    # 6. validate new packages
-    # 7. copy new packages to repo directory
-    # 8. download repodata.json and repodata.json.bz2
-    # 9. copy new repodata.json and repodata.json.bz2 into the repo
-    summary = {
-        "validating-existing": set(),
-        "validating-new": set(),
-        "downloaded": set(),
-        "blacklisted": set(),
-        "to-mirror": set(),
-    }
-    # Implementation:
+    # 1. fetch and parse the upstream repodata. With a repodata cache, skip
+    #    the run if neither the repodata nor the configuration changed since
+    #    the last complete run. With stream_repodata, drop blacklisted
+    #    packages while parsing.
+    # 2. figure out the blacklisted packages, un-blacklist the whitelisted
+    #    ones and, with include_depends, their dependencies (across the
+    #    platforms sharing `closure`, if given)
+    # 3. remove non-latest packages if so specified
+    # 4. validate the local packages, skipping those the validation cache
+    #    trusts, and remove invalid and blacklisted ones
+    # 5. figure out final list of packages to mirror
+    # 6. download new packages to a temp dir, verifying them while they are
+    #    streamed, and validate those which could not be verified
+    # 7. write the pruned repodata.json and repodata.json.bz2 and move them
+    #    and the new packages into the repo
+    # 8. record the run as complete if every new package was verified
+    summary = _new_summary()
     local_directory = os.path.join(target_directory, platform)
     if not dry_run:
         os.makedirs(local_directory, exist_ok=True)
 
-    info, packages = get_repodata(
-        upstream_channel, platform, proxies=proxies, ssl_verify=ssl_verify
-    )
+    # packages which were blacklisted while the repodata was parsed
+    excluded_packages: Set[str] = set()
+    keep = None
+    if stream_repodata and include_depends:
+        logger.info(
+            "include_depends needs all repodata, not filtering it while parsing"
+        )
+    elif stream_repodata:
+        excluded = _excluded_matcher(blacklist, whitelist)
+        local_packages = set(_list_conda_packages(local_directory))
+
+        def _keep(pkg_name, pkg_info):
+            pkg_info.setdefault("subdir", platform)
+            # the metadata of local packages is needed for the mirror's repodata
+            if pkg_name in local_packages or not excluded(pkg_info):
+                return True
+            excluded_packages.add(pkg_name)
+            return False
+
+        keep = _keep
+
+    # 1. fetch and parse the upstream repodata
+    session = context.session
+    if repodata_cache_dir:
+        _, channel_name = _maybe_split_channel(upstream_channel)
+        cache = RepodataCache(repodata_cache_dir, channel_name, platform)
+        modified = cache.fetch(
+            _repodata_url(upstream_channel, platform),
+            session,
+            proxies=proxies,
+            ssl_verify=ssl_verify,
+            use_jlap=use_jlap,
+        )
+        fingerprint = _config_fingerprint(
+            upstream_channel=upstream_channel,
+            target_directory=os.path.abspath(target_directory),
+            platform=platform,
+            blacklist=blacklist,
+            whitelist=whitelist,
+            include_depends=include_depends,
+            latest_non_dev=latest_non_dev,
+            latest_dev=latest_dev,
+            hash_policy=hash_policy,
+            no_validate_target=no_validate_target,
+        )
+        # with a closure, what to mirror also depends on the other platforms
+        if (
+            not (modified or dry_run)
+            and closure is None
+            and cache.state.get("mirrored") == fingerprint
+            and os.path.exists(os.path.join(local_directory, "repodata.json"))
+        ):
+            logger.info(
+                "Upstream repodata and configuration are unchanged since the "
+                "last complete run. Nothing to do."
+            )
+            return summary
+        with open(cache.path, "rb") as f:
+            info, packages = _parse_repodata(f, platform, keep)
+    else:
+        cache = None
+        info, packages = get_repodata(
+            upstream_channel,
+            platform,
+            proxies=proxies,
+            ssl_verify=ssl_verify,
+            keep=keep,
+        )
 
-    # 1. validate local repo
-    # validating all packages is taking many hours.
-    # _validate_packages(repodata=repodata,
-    #                    package_directory=local_directory,
-    #                    num_threads=num_threads)
+    # 2. figure out excluded packages and un-blacklist packages that are
+    # actually whitelisted
+    blacklisted, required_packages = _filter_packages(packages, blacklist, whitelist)
+    excluded_packages.update(blacklisted)
+    excluded_packages.difference_update(required_packages)
+    logger.debug(
+        "%d packages are blacklisted and %d whitelisted",
+        len(excluded_packages),
+        len(required_packages),
+    )
 
-    # 2. figure out excluded packages
-    excluded_packages: Set[str] = set()
-    required_packages: Set[str] = set()
-    # match blacklist conditions
-    if blacklist:
-        for blist in blacklist:
-            logger.debug("exclude item: %s", blist)
-            matched_packages = list(_match(packages, blist))
-            logger.debug(pformat(matched_packages))
-            excluded_packages.update(matched_packages)
-
-    # 3. un-blacklist packages that are actually whitelisted
-    # match whitelist on blacklist
-    if whitelist:
-        for wlist in whitelist:
-            matched_packages = list(_match(packages, wlist))
-            required_packages.update(matched_packages)
-        excluded_packages.difference_update(required_packages)
-
-    if include_depends:
+    if include_depends and closure is not None:
+        excluded_packages = closure.restore(
+            platform, packages, excluded_packages, required_packages
+        )
+    elif include_depends:
         excluded_packages = _restore_required_dependencies(
             packages, excluded_packages, required_packages
         )
@@ -1179,7 +3936,7 @@ def main(
 
     possible_packages_to_mirror = set(packages.keys()) - excluded_packages
 
-    # 3b remove non-latest packages if so specified.
+    # 3. remove non-latest packages if so specified.
     non_recent_packages = _find_non_recent_packages(
         packages,
         include=possible_packages_to_mirror,
@@ -1193,12 +3950,49 @@ def main(
     desired_repodata = {
         pkgname: packages[pkgname] for pkgname in possible_packages_to_mirror
     }
+    validated = None
+    if validation_cache and not dry_run:
+        if validation_cache_dir is None:
+            validation_cache_dir = repodata_cache_dir or os.path.join(
+                temp_directory, "validation-cache"
+            )
+        _, channel_name = _maybe_split_channel(upstream_channel)
+        validated = ValidationCache(
+            local_directory,
+            os.path.join(validation_cache_dir, channel_name, platform),
+            max_age=validation_cache_max_age,
+            hash_policy=hash_policy,
+        )
     if not (dry_run or no_validate_target):
         # Only validate if we're not doing a dry-run
+        trusted = validated.trusted(desired_repodata) if validated else set()
+        if trusted:
+            logger.info("Skipping %d unchanged validated packages", len(trusted))
+        passed = []
+
+        def record_passed(result):
+            # record in batches so an interrupted run keeps most of its work
+            path, reason = result
+            if reason is None:
+                passed.append(os.path.basename(path))
+            if len(passed) >= VALIDATION_CACHE_BATCH_SIZE:
+                validated.record(passed, desired_repodata)
+                del passed[:]
+
         validation_results = _validate_packages(
-            desired_repodata, local_directory, num_threads
+            desired_repodata,
+            local_directory,
+            num_threads,
+            trusted=trusted,
+            buffer_size=validation_buffer_size,
+            executor=validation_executor,
+            hash_policy=hash_policy,
+            pool=context.validation_pool,
+            on_result=record_passed if validated else None,
         )
         summary["validating-existing"].update(validation_results)
+        if validated:
+            validated.record(passed, desired_repodata)
     # 5. figure out final list of packages to mirror
     # do the set difference of what is local and what is in the final
     # mirror list
@@ -1212,66 +4006,73 @@ def main(
         return summary
 
     # 6. for each download:
-    # a. download to temp file
-    # b. validate contents of temp file
-    # c. move to local repo
+    # a. download to temp file, verifying it while it is streamed
+    # b. validate contents of temp file if it could not be verified
     # mirror all new packages
-    total_bytes = 0
     minimum_free_space_kb = minimum_free_space * 1024 * 1024
     download_url, channel = _maybe_split_channel(upstream_channel)
-    session = requests.Session()
     with tempfile.TemporaryDirectory(dir=temp_directory) as download_dir:
         logger.info("downloading to the tempdir %s", download_dir)
-        for package_name in tqdm(
-            sorted(to_mirror),
-            desc=platform,
-            unit="package",
-            leave=False,
-            disable=not show_progress,
-        ):
-            url = download_url.format(
+        downloads = {
+            download_url.format(
                 channel=channel, platform=platform, file_name=package_name
-            )
-            try:
-                # make sure we have enough free disk space in the temp folder to meet threshold
-                if shutil.disk_usage(download_dir).free < minimum_free_space_kb:
-                    logger.error(
-                        "Disk space below threshold in %s. Aborting download.",
-                        download_dir,
-                    )
-                    break
-
-                # download package
-                total_bytes += _download_backoff_retry(
-                    url,
+            ): packages[package_name]
+            for package_name in sorted(to_mirror)
+        }
+        download_kwargs = dict(
+            download_workers=download_workers,
+            minimum_free_space=minimum_free_space_kb,
+            proxies=proxies,
+            ssl_verify=ssl_verify,
+            chunk_size=chunk_size,
+            max_retries=max_retries,
+            show_progress=show_progress,
+            desc=platform,
+            hash_policy=hash_policy,
+        )
+        start_time = time.monotonic()
+        if download_backend == "asyncio":
+            downloaded, verified = context.run(
+                _download_packages_async(
+                    downloads,
                     download_dir,
-                    session,
-                    proxies=proxies,
-                    ssl_verify=ssl_verify,
-                    chunk_size=chunk_size,
-                    max_retries=max_retries,
-                    show_progress=show_progress,
+                    local_directory,
+                    connections_per_host=connections_per_host,
+                    shared_semaphore=context.download_semaphore,
+                    limiter=context.limiter,
+                    **download_kwargs,
                 )
+            )
+        else:
+            downloaded, verified = _download_packages(
+                downloads,
+                download_dir,
+                local_directory,
+                session,
+                executor=context.download_executor,
+                limiter=context.limiter,
+                **download_kwargs,
+            )
+        logger.info(
+            "Downloaded %d packages in %.2f seconds using the %s backend",
+            len(downloaded),
+            time.monotonic() - start_time,
+            download_backend,
+        )
+        summary["downloaded"].update((url, download_dir) for url in downloaded)
 
-                # make sure we have enough free disk space in the target folder to meet threshold
-                # while also being able to fit the packages we have already downloaded
-                if (
-                    shutil.disk_usage(local_directory).free - total_bytes
-                ) < minimum_free_space_kb:
-                    logger.error(
-                        "Disk space below threshold in %s. Aborting download",
-                        local_directory,
-                    )
-                    break
-
-                summary["downloaded"].add((url, download_dir))
-            except Exception as ex:
-                logger.exception("Unexpected error: %s. Aborting download.", ex)
-                break
-
-        # validate all packages in the download directory
+        # validate the packages in the download directory which could not be
+        # verified while they were being downloaded
+        summary["validating-new"].update(verified)
         validation_results = _validate_packages(
-            packages, download_dir, num_threads=num_threads
+            packages,
+            download_dir,
+            num_threads,
+            trusted={os.path.basename(path) for path, reason in verified},
+            buffer_size=validation_buffer_size,
+            executor=validation_executor,
+            hash_policy=hash_policy,
+            pool=context.validation_pool,
         )
         summary["validating-new"].update(validation_results)
         logger.debug(
@@ -1280,7 +4081,7 @@ def main(
             pformat(os.listdir(download_dir)),
         )
 
-        # 8. Use already downloaded repodata.json contents but prune it of
+        # 7. Use already downloaded repodata.json contents but prune it of
         # packages we don't want
         repodata = {"info": info, "packages": packages}
 
@@ -1296,23 +4097,29 @@ def main(
         _write_repodata(download_dir, repodata)
 
         # move new conda packages
-        for f in _list_conda_packages(download_dir):
+        new_packages = _list_conda_packages(download_dir)
+        for f in new_packages:
             old_path = os.path.join(download_dir, f)
             new_path = os.path.join(local_directory, f)
             logger.info("moving %s to %s", old_path, new_path)
             shutil.move(old_path, new_path)
+        if validated:
+            validated.record(new_packages, packages)
 
         for f in ("repodata.json", "repodata.json.bz2"):
             download_path = os.path.join(download_dir, f)
             move_path = os.path.join(local_directory, f)
             shutil.move(download_path, move_path)
 
-    # Also need to make a "noarch" channel or conda gets mad
-    noarch_path = os.path.join(target_directory, "noarch")
-    if not os.path.exists(noarch_path):
-        os.makedirs(noarch_path, exist_ok=True)
-        noarch_repodata = {"info": {}, "packages": {}}
-        _write_repodata(noarch_path, noarch_repodata)
+    complete = len(downloaded) == len(downloads) and all(
+        reason is None for _, reason in summary["validating-new"]
+    )
+    if cache is not None and complete:
+        # 8. remember that the mirror is complete for this upstream state so that
+        # the next run can be skipped if nothing changes. Packages which were
+        # removed because they failed verification are downloaded again.
+        cache.state["mirrored"] = fingerprint
+        cache.save_state()
 
     return summary
 
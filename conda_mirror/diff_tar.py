@@ -20,19 +20,29 @@ class NoReferenceError(FileNotFoundError):
     pass
 
 
-def md5_file(path):
+def hash_file(path, algorithms=("md5",)):
     """
-    Return the MD5 hashsum of the file given by `path` in hexadecimal
-    representation.
+    Return a dictionary mapping each of the hashlib `algorithms` to the
+    hashsum of the file given by `path` in hexadecimal representation.
+    The file is only read once, however many algorithms are given.
     """
-    h = hashlib.new("md5")
+    hashes = [hashlib.new(algorithm) for algorithm in algorithms]
     with open(path, "rb") as fi:
         while 1:
             chunk = fi.read(262144)
             if not chunk:
                 break
-            h.update(chunk)
-    return h.hexdigest()
+            for h in hashes:
+                h.update(chunk)
+    return {algorithm: h.hexdigest() for algorithm, h in zip(algorithms, hashes)}
+
+
+def md5_file(path):
+    """
+    Return the MD5 hashsum of the file given by `path` in hexadecimal
+    representation.
+    """
+    return hash_file(path)["md5"]
 
 
 def find_repos(mirror_dir):
@@ -61,16 +71,17 @@ def all_repodata(mirror_dir):
 
 def verify_all_repos(mirror_dir):
     """
-    Verify all the MD5 sum of all conda packages listed in all repodata.json
-    files in the repository.
+    Verify the SHA256 sum, or the MD5 sum for packages without one, of all
+    conda packages listed in all repodata.json files in the repository.
     """
     d = all_repodata(mirror_dir)
     for repo_path, index in d.items():
         for fn, info in index.items():
             path = join(repo_path, fn)
-            if info["md5"] == md5_file(path):
+            algorithm = "sha256" if info.get("sha256") else "md5"
+            if info[algorithm] == hash_file(path, [algorithm])[algorithm]:
                 continue
-            print("MD5 mismatch: %s" % path)
+            print("%s mismatch: %s" % (algorithm.upper(), path))
 
 
 def write_reference(mirror_dir, outfile=None):
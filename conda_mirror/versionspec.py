@@ -9,9 +9,11 @@
 # not part of the officially supported public API nor is it available in a package
 # that can be installed safely outside of the base environment.
 
+from collections import OrderedDict
 from logging import getLogger
 import operator as op
 import re
+import threading
 
 from itertools import zip_longest
 
@@ -21,6 +23,13 @@ version_check_re = re.compile(r"^[\*\.\+!_0-9a-z]+$")
 version_split_re = re.compile("([0-9]+|[*]+|[^0-9*]+)")
 version_cache = {}
 
+# Default maximum number of entries of the caches of parsed versions and specs
+DEFAULT_CACHE_SIZE = 65536
+
+# Sort key element marking the end of a list of (sub)components, which is
+# equivalent to padding it with zeros, see VersionOrder.sort_key.
+SORT_KEY_END = (1, 0, 0.5)
+
 
 class excepts(object):
     def __init__(self, exc, func, handler=lambda exc: None):
@@ -40,6 +49,71 @@ class InvalidVersionSpec(ValueError):
         super().__init__(f"Invalid version '{invalid_spec}s': {details}s")
 
 
+class LRUCache(object):
+    """A thread-safe mapping holding at most `maxsize` entries, which evicts
+    the least recently used entry when full. `maxsize=None` means no limit.
+
+    Counts hits, misses and evictions, see `stats`.
+    """
+
+    def __init__(self, maxsize=DEFAULT_CACHE_SIZE):
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.maxsize = maxsize
+        self.hits = self.misses = self.evictions = 0
+
+    def __getitem__(self, key):
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                raise
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def __setitem__(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            self._evict()
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+    def _evict(self):
+        if self.maxsize is None:
+            return
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def resize(self, maxsize):
+        """Change the maximum number of entries, evicting entries if needed."""
+        with self._lock:
+            self.maxsize = maxsize
+            self._evict()
+
+    def clear(self):
+        """Remove all entries and reset the counters."""
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
 class SingleStrArgCachingType(type):
     def __call__(cls, arg):
         if isinstance(arg, cls):
@@ -167,7 +241,7 @@ class VersionOrder(metaclass=SingleStrArgCachingType):
       1.0.1_ < 1.0.1a =>  True   # ensure correct ordering for openssl
     """
 
-    _cache_ = {}
+    _cache_ = LRUCache()
 
     def __init__(self, vstr):
         # version comparison is case-insensitive
@@ -254,6 +328,42 @@ class VersionOrder(metaclass=SingleStrArgCachingType):
     def __repr__(self):
         return '%s("%s")' % (self.__class__.__name__, self)
 
+    @property
+    def sort_key(self):
+        """A tuple which compares like this version, so that versions can be
+        sorted with native tuple comparisons: for versions a and b,
+        a < b if and only if a.sort_key < b.sort_key, and likewise for ==.
+        """
+        try:
+            return self._sort_key
+        except AttributeError:
+            self._sort_key = (
+                _components_sort_key(self.version),
+                _components_sort_key(self.local),
+            )
+            return self._sort_key
+
+    @classmethod
+    def sort_keys(cls, version_strs):
+        """The sort keys of many version strings, parsing each distinct
+        string only once.
+
+        Examples:
+            >>> versions = ["1.10", "1.9", "1.9.0", "1.1dev1"]
+            >>> keys = VersionOrder.sort_keys(versions)
+            >>> [v for _, v in sorted(zip(keys, versions))]
+            ['1.1dev1', '1.9', '1.9.0', '1.10']
+        """
+        keys = {}
+        result = []
+        for vstr in version_strs:
+            try:
+                key = keys[vstr]
+            except KeyError:
+                key = keys[vstr] = cls(vstr).sort_key
+            result.append(key)
+        return result
+
     def _eq(self, t1, t2):
         for v1, v2 in zip_longest(t1, t2, fillvalue=[]):
             for c1, c2 in zip_longest(v1, v2, fillvalue=self.fillvalue):
@@ -321,6 +431,63 @@ class VersionOrder(metaclass=SingleStrArgCachingType):
         return not (self < other)
 
 
+def set_cache_size(maxsize):
+    """Set the maximum number of entries of the caches of VersionOrder,
+    VersionSpec and BuildNumberMatch instances. `None` means no limit."""
+    for cls in CACHING_TYPES:
+        cls._cache_.resize(maxsize)
+
+
+def cache_stats():
+    """The size and hit, miss and eviction counts of the caches of VersionOrder,
+    VersionSpec and BuildNumberMatch instances, by class name."""
+    return {cls.__name__: cls._cache_.stats() for cls in CACHING_TYPES}
+
+
+def _subcomponents_sort_key(subcomponents):
+    # Elements of the key are (0, str) for strings, which are smaller than
+    # (1, number) for numbers. Missing subcomponents count as 0, so trailing
+    # zeros are dropped and the key ends with SORT_KEY_END instead. A 0 that
+    # is followed by more subcomponents becomes (1, 0, flag), where flag tells
+    # whether the next non-zero subcomponent is a string (0) or a number (1),
+    # which decides how it compares to the end of a shorter version.
+    items = list(subcomponents)
+    while items and not isinstance(items[-1], str) and items[-1] == 0:
+        items.pop()
+    key = [SORT_KEY_END]
+    flag = None
+    for c in reversed(items):
+        if isinstance(c, str):
+            key.append((0, c))
+            flag = 0
+        elif c == 0:
+            key.append((1, 0, flag))
+        else:
+            key.append((1, c))
+            flag = 1
+    key.reverse()
+    return tuple(key)
+
+
+def _components_sort_key(components):
+    # The same scheme as for subcomponents one level up: missing components
+    # count as all zero components, whose key is (SORT_KEY_END,).
+    zero = (SORT_KEY_END,)
+    keys = [_subcomponents_sort_key(c) for c in components]
+    while keys and keys[-1] == zero:
+        keys.pop()
+    key = [(SORT_KEY_END, 0.5)]
+    flag = None
+    for k in reversed(keys):
+        if k == zero:
+            key.append((SORT_KEY_END, flag))
+        else:
+            key.append(k)
+            flag = 0 if k < zero else 1
+    key.reverse()
+    return tuple(key)
+
+
 # each token slurps up leading whitespace, which we strip out.
 VSPEC_TOKENS = (
     r"\s*\^[^$]*[$]|"  # regexes
@@ -448,6 +615,15 @@ OPERATOR_MAP = {
     "~=": compatible_release_operator,
 }
 OPERATOR_START = frozenset(("=", "<", ">", "!", "~"))
+# operators which compile to comparisons of VersionOrder.sort_key, as
+# (is lower bound, is upper bound, is inclusive)
+BOUND_OPERATORS = {
+    OPERATOR_MAP["=="]: (True, True, True),
+    OPERATOR_MAP["<="]: (False, True, True),
+    OPERATOR_MAP[">="]: (True, False, True),
+    OPERATOR_MAP["<"]: (False, True, False),
+    OPERATOR_MAP[">"]: (True, False, False),
+}
 
 
 class BaseSpec(object):
@@ -515,7 +691,7 @@ class BaseSpec(object):
 class VersionSpec(
     BaseSpec, metaclass=SingleStrArgCachingType
 ):  # lgtm [py/missing-equals]
-    _cache_ = {}
+    _cache_ = LRUCache()
 
     def __init__(self, vspec):
         vspec_str, matcher, is_exact = self.get_matcher(vspec)
@@ -613,6 +789,44 @@ class VersionSpec(
             is_exact = True
         return vspec_str, matcher, is_exact
 
+    @property
+    def predicate(self):
+        """A function matching versions like `match`, compiled from the spec
+        tree: the relational parts of each conjunction are merged into bounds
+        on `VersionOrder.sort_key` and the regexes of each disjunction into
+        one regex, so that each candidate version is parsed once and checked
+        with a few tuple comparisons.
+
+        Examples:
+            >>> match = VersionSpec(">=1.8,<2|1.7.*").predicate
+            >>> [match(v) for v in ("1.7.1", "1.8", "1.9a", "2.0", "1.6")]
+            [True, True, True, False, False]
+        """
+        try:
+            return self._predicate
+        except AttributeError:
+            pass
+        node = _compile_spec(self)
+        if _needs_order(self):
+            fallback = self.match
+
+            def predicate(version):
+                try:
+                    vo = VersionOrder(str(version))
+                except ValueError:
+                    # the spec tree decides whether an invalid version is an
+                    # error or is matched by a regex before it is parsed
+                    return fallback(version)
+                return node(version, vo, vo.sort_key)
+
+        else:
+
+            def predicate(version):
+                return node(version, None, None)
+
+        self._predicate = predicate
+        return predicate
+
     def merge(self, other):
         assert isinstance(other, self.__class__)
         return self.__class__(",".join(sorted((self.raw_value, other.raw_value))))
@@ -625,10 +839,156 @@ class VersionSpec(
         return "|".join(sorted(options))
 
 
+# The compiled nodes of a VersionSpec tree are functions of the version
+# string, its VersionOrder and its sort key, the latter two being None if
+# the tree has no relational parts.
+
+
+def _always_true(version, vo, key):
+    return True
+
+
+def _always_false(version, vo, key):
+    return False
+
+
+def _regex_node(regex_match):
+    return lambda version, vo, key: regex_match(version) is not None
+
+
+def _needs_order(spec):
+    """Whether matching a VersionSpec tree parses the versions."""
+    if spec.match == spec.any_match or spec.match == spec.all_match:
+        return any(_needs_order(s) for s in spec.tup)
+    return spec.match == spec.operator_match
+
+
+def _compile_spec(spec):
+    """Compile a VersionSpec tree into a node."""
+    if spec.match == spec.any_match:
+        return _compile_any(spec.tup)
+    if spec.match == spec.all_match:
+        return _compile_all(spec.tup)
+    if spec.match == spec.operator_match and spec.operator_func in BOUND_OPERATORS:
+        return _compile_all((spec,))
+    if spec.match == spec.always_true_match:
+        return _always_true
+    if spec.match == spec.regex_match:
+        return _regex_node(spec.regex.match)
+    if spec.match == spec.exact_match:
+        spec_str = spec.spec
+        return lambda version, vo, key: version == spec_str
+    operator_func, matcher_vo = spec.operator_func, spec.matcher_vo
+    return lambda version, vo, key: operator_func(vo, matcher_vo)
+
+
+def _compile_all(specs):
+    # bounds are (sort key, inclusive)
+    lower = upper = None
+    excluded = set()
+    nodes = []
+    specs = list(specs)
+    while specs:
+        spec = specs.pop()
+        if spec.match == spec.all_match:
+            specs.extend(spec.tup)
+        elif spec.match == spec.always_true_match:
+            continue
+        elif (
+            spec.match == spec.operator_match
+            and spec.operator_func == OPERATOR_MAP["!="]
+        ):
+            excluded.add(spec.matcher_vo.sort_key)
+        elif (
+            spec.match == spec.operator_match and spec.operator_func in BOUND_OPERATORS
+        ):
+            is_lower, is_upper, inclusive = BOUND_OPERATORS[spec.operator_func]
+            key = spec.matcher_vo.sort_key
+            if is_lower and (
+                lower is None or key > lower[0] or (key == lower[0] and not inclusive)
+            ):
+                lower = (key, inclusive)
+            if is_upper and (
+                upper is None or key < upper[0] or (key == upper[0] and not inclusive)
+            ):
+                upper = (key, inclusive)
+        else:
+            nodes.append(_compile_spec(spec))
+
+    if lower is not None and upper is not None:
+        if lower[0] > upper[0] or (
+            lower[0] == upper[0] and not (lower[1] and upper[1])
+        ):
+            return _always_false
+    if lower is None and upper is None and not excluded:
+        if not nodes:
+            return _always_true
+        if len(nodes) == 1:
+            return nodes[0]
+    lower_key, lower_inclusive = lower or (None, True)
+    upper_key, upper_inclusive = upper or (None, True)
+
+    def match(version, vo, key):
+        if lower_key is not None and (
+            key < lower_key if lower_inclusive else key <= lower_key
+        ):
+            return False
+        if upper_key is not None and (
+            key > upper_key if upper_inclusive else key >= upper_key
+        ):
+            return False
+        if key in excluded:
+            return False
+        for node in nodes:
+            if not node(version, vo, key):
+                return False
+        return True
+
+    return match
+
+
+def _compile_any(specs):
+    patterns = []
+    nodes = []
+    specs = list(specs)
+    while specs:
+        spec = specs.pop()
+        if spec.match == spec.any_match:
+            specs.extend(spec.tup)
+        elif spec.match == spec.always_true_match:
+            return _always_true
+        elif spec.match == spec.regex_match:
+            patterns.append(spec.regex.pattern)
+        else:
+            nodes.append(_compile_spec(spec))
+
+    regex_match = None
+    if len(patterns) == 1:
+        regex_match = re.compile(patterns[0]).match
+    elif patterns:
+        try:
+            regex_match = re.compile("|".join("(?:%s)" % p for p in patterns)).match
+        except re.error:
+            # e.g. global flags, which are only allowed at the start
+            nodes.extend(_regex_node(re.compile(p).match) for p in patterns)
+    if regex_match is None and len(nodes) == 1:
+        return nodes[0]
+
+    def match(version, vo, key):
+        if regex_match is not None and regex_match(version) is not None:
+            return True
+        for node in nodes:
+            if node(version, vo, key):
+                return True
+        return False
+
+    return match
+
+
 class BuildNumberMatch(
     BaseSpec, metaclass=SingleStrArgCachingType
 ):  # lgtm [py/missing-equals]
-    _cache_ = {}
+    _cache_ = LRUCache()
 
     def __init__(self, vspec):
         vspec_str, matcher, is_exact = self.get_matcher(vspec)
@@ -700,3 +1060,6 @@ class BuildNumberMatch(
 
     def __repr__(self):
         return str(self.spec)
+
+
+CACHING_TYPES = (VersionOrder, VersionSpec, BuildNumberMatch)
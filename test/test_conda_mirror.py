@@ -1,15 +1,23 @@
 import bz2
 import copy
+import functools
+import hashlib
+import http.server
+import io
 import itertools
 import json
 import os
 import sys
+import tarfile
+import threading
+import zipfile
 
 from os.path import join
 
 from conda_mirror import conda_mirror
 
 import pytest
+import yaml
 
 
 anaconda_channel = "https://repo.continuum.io/pkgs/free"
@@ -41,6 +49,88 @@ def test_match(repodata):
         assert v["version"].startswith("3.7.")
 
 
+def test_filter_packages():
+    packages = {
+        "%s-%s-%s.tar.bz2"
+        % (name, version, build): {
+            "name": name,
+            "version": version,
+            "build": build,
+            "license": license,
+        }
+        for name, version, build, license in [
+            ("jupyter", "1.0", "py_0", "BSD"),
+            ("jupyterlab", "3.1", "py_0", "BSD"),
+            ("python", "3.7.1", "h0", "PSF"),
+            ("python", "3.8.0", "h0", "PSF"),
+            ("ghostscript", "9.5", "0", "AGPL-3.0"),
+            ("mystery", "1.0", "0", ""),
+        ]
+    }
+    blacklist = [
+        {"license": "*agpl*"},
+        {"license": ""},
+        {"name": "jupyter*"},
+        {"name": "python", "version": ">=3.8"},
+    ]
+    whitelist = [{"name": "JUPYTER"}, {"license": "*gpl*", "version": "9.*"}]
+
+    excluded, whitelisted = conda_mirror._filter_packages(
+        packages, blacklist, whitelist
+    )
+    assert excluded == {
+        "jupyterlab-3.1-py_0.tar.bz2",
+        "python-3.8.0-h0.tar.bz2",
+        "mystery-1.0-0.tar.bz2",
+    }
+    assert whitelisted == {"jupyter-1.0-py_0.tar.bz2", "ghostscript-9.5-0.tar.bz2"}
+    # the compiled rules agree with matching the entries one by one
+    for rules in (blacklist, whitelist):
+        _, matches = conda_mirror._compile_rules(rules)
+        keys, _ = conda_mirror._compile_rules(blacklist + whitelist)
+        expected = set()
+        for rule in rules:
+            expected.update(conda_mirror._match(packages, rule))
+        assert expected == {
+            pkg_name
+            for pkg_name, pkg_info in packages.items()
+            if matches(conda_mirror._package_values(pkg_info, keys))
+        }
+    excluded_matcher = conda_mirror._excluded_matcher(blacklist, whitelist)
+    assert excluded == {
+        pkg_name
+        for pkg_name, pkg_info in packages.items()
+        if excluded_matcher(pkg_info)
+    }
+    # the name index resolves names, name prefixes and other globs
+    index = conda_mirror._NameIndex(packages)
+    assert (
+        index.match("python")
+        == index.match("pyth?n")
+        == [
+            "python-3.7.1-h0.tar.bz2",
+            "python-3.8.0-h0.tar.bz2",
+        ]
+    )
+    assert index.match("jupyter*") == [
+        "jupyter-1.0-py_0.tar.bz2",
+        "jupyterlab-3.1-py_0.tar.bz2",
+    ]
+    assert index.match("*lab") == ["jupyterlab-3.1-py_0.tar.bz2"]
+    assert index.match("java*") == index.match("java") == []
+
+
+def test_find_non_recent_packages():
+    packages = {
+        "a-%s-0.tar.bz2" % version: {"name": "a", "version": version}
+        for version in ["1.9", "1.10", "1.10.1", "2.0rc1", "2.0dev1", "2.0.dev2"]
+    }
+    non_recent = conda_mirror._find_non_recent_packages(
+        packages, include=packages, latest_non_dev=2, latest_dev=1
+    )
+    assert non_recent == {"a-1.9-0.tar.bz2", "a-1.10-0.tar.bz2", "a-2.0dev1-0.tar.bz2"}
+
+
 def test_restore_required_dependencies(repodata):
     """Unit tests for internal _restore_required_dependencies function."""
     from conda_mirror.conda_mirror import (
@@ -230,3 +320,1096 @@ def test_dry_run_dumb(tmpdir):
     assert (
         len(ret["to-mirror"]) > 1
     ), "We should have a great deal of packages slated to download"
+
+
+class _QuietHandler(http.server.SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+class _RangeHandler(_QuietHandler):
+    """Honours Range requests and records the Range header of each request."""
+
+    range_headers = []
+    flaky = False
+
+    def do_GET(self):
+        path = self.translate_path(self.path)
+        if not os.path.isfile(path):
+            self.send_error(404)
+            return
+        with open(path, "rb") as f:
+            data = f.read()
+        range_header = self.headers.get("Range")
+        self.range_headers.append(range_header)
+        start = int(range_header[6:-1]) if range_header else 0
+        self.send_response(206 if range_header else 200)
+        if range_header:
+            self.send_header(
+                "Content-Range", "bytes %d-%d/%d" % (start, len(data) - 1, len(data))
+            )
+        self.send_header("Content-Length", str(len(data) - start))
+        self.end_headers()
+        if range_header or not self.flaky:
+            self.wfile.write(data[start:])
+        else:
+            self.wfile.write(data[: len(data) // 2])
+            self.close_connection = True
+
+
+class _FlakyRangeHandler(_RangeHandler):
+    """Like `_RangeHandler`, but breaks off every response to a request
+    without a Range header halfway through the file."""
+
+    flaky = True
+
+
+def _serve_directory(root, handler_class):
+    handler = functools.partial(handler_class, directory=root.strpath)
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, "http://127.0.0.1:%d" % server.server_address[1]
+
+
+@pytest.fixture
+def http_server(tmpdir):
+    """Serve the contents of a temporary directory over HTTP."""
+    root = tmpdir.mkdir("upstream")
+    server, url = _serve_directory(root, _QuietHandler)
+    yield root, url
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def range_http_server(tmpdir):
+    """Like `http_server`, but see `_RangeHandler`."""
+    root = tmpdir.mkdir("upstream")
+    server, url = _serve_directory(root, _RangeHandler)
+    _RangeHandler.range_headers = []
+    yield root, url
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def flaky_http_server(tmpdir):
+    """Like `http_server`, but see `_FlakyRangeHandler`."""
+    root = tmpdir.mkdir("upstream")
+    server, url = _serve_directory(root, _FlakyRangeHandler)
+    _FlakyRangeHandler.range_headers = []
+    yield root, url
+    server.shutdown()
+    server.server_close()
+
+
+def test_validate_hashes_in_chunks(tmpdir):
+    content = os.urandom(1000)
+    package = tmpdir.join("a-1.0-0.tar.bz2")
+    package.write_binary(content)
+    md5 = hashlib.md5(content).hexdigest()
+    assert conda_mirror._validate(package.strpath, md5=md5, buffer_size=7) == (
+        package.strpath,
+        None,
+    )
+    path, reason = conda_mirror._validate(package.strpath, md5="0" * 32, buffer_size=7)
+    assert "Failed md5 validation" in reason
+    assert not package.check()
+
+
+@pytest.mark.parametrize(
+    "hash_policy,md5,sha256,expected",
+    [
+        ("md5", "m", "s", {"md5": "m"}),
+        ("sha256", "m", "s", {"sha256": "s"}),
+        ("sha256", "m", None, {}),
+        ("prefer-sha256", "m", "s", {"sha256": "s"}),
+        ("prefer-sha256", "m", None, {"md5": "m"}),
+        ("all", "m", "s", {"md5": "m", "sha256": "s"}),
+        ("all", None, "s", {"sha256": "s"}),
+    ],
+)
+def test_expected_digests(hash_policy, md5, sha256, expected):
+    assert conda_mirror._expected_digests(hash_policy, md5=md5, sha256=sha256) == (
+        expected
+    )
+
+
+@pytest.mark.parametrize("hash_policy", conda_mirror.HASH_POLICIES)
+def test_validate_hash_policy(tmpdir, hash_policy):
+    content = b"package"
+    package = tmpdir.join("a-1.0-0.tar.bz2")
+    package.write_binary(content)
+    md5 = hashlib.md5(content).hexdigest()
+    sha256 = hashlib.sha256(content).hexdigest()
+    _, reason = conda_mirror._validate(
+        package.strpath, md5=md5, sha256=sha256, hash_policy=hash_policy
+    )
+    assert reason is None
+
+    # only the digests selected by the policy are checked
+    _, reason = conda_mirror._validate(
+        package.strpath, md5=md5, sha256="0" * 64, hash_policy=hash_policy
+    )
+    if hash_policy == "md5":
+        assert reason is None
+    else:
+        assert "Failed sha256 validation" in reason
+
+
+def _write_tar_bz2(path, members):
+    with tarfile.open(path, "w:bz2") as t:
+        for name, content in members.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(content)
+            t.addfile(info, io.BytesIO(content))
+
+
+def _write_conda(path, members):
+    with zipfile.ZipFile(path, "w") as z:
+        for name, content in members.items():
+            z.writestr(name, content)
+
+
+@pytest.mark.parametrize(
+    "filename,write,members,reason",
+    [
+        (
+            "a-1.0-0.tar.bz2",
+            _write_tar_bz2,
+            {"info/index.json": b"{}", "lib/a.so": b"a" * 1000},
+            None,
+        ),
+        ("a-1.0-0.tar.bz2", _write_tar_bz2, {"lib/a.so": b"a"}, "Tarfile has no"),
+        (
+            "a-1.0-0.conda",
+            _write_conda,
+            {"metadata.json": b"{}", "info-a-1.0-0.tar.zst": b"", "pkg-a.tar.zst": b""},
+            None,
+        ),
+        ("a-1.0-0.conda", _write_conda, {"pkg-a-1.0-0.tar.zst": b""}, "Zipfile has no"),
+        ("a-1.0-0.conda", _write_tar_bz2, {"info/index.json": b"{}"}, "Zipfile read"),
+        ("a-1.0-0.tar.bz2", _write_conda, {"info-a.tar.zst": b""}, "Tarfile read"),
+    ],
+)
+def test_validate_package_structure(tmpdir, filename, write, members, reason):
+    path = tmpdir.join(filename).strpath
+    write(path, members)
+    _, result = conda_mirror._validate(path)
+    if reason is None:
+        assert result is None
+        assert os.path.exists(path)
+    else:
+        assert reason in result
+        assert not os.path.exists(path)
+
+
+@pytest.mark.parametrize("executor", conda_mirror.VALIDATION_EXECUTORS)
+def test_validate_packages(tmpdir, executor):
+    repodata = {}
+    for name in "abcd":
+        content = name.encode() * 100
+        tmpdir.join("%s-1.0-0.tar.bz2" % name).write_binary(content)
+        repodata["%s-1.0-0.tar.bz2" % name] = {"md5": hashlib.md5(content).hexdigest()}
+    tmpdir.join("c-1.0-0.tar.bz2").write_binary(b"corrupt")
+    del repodata["d-1.0-0.tar.bz2"]
+
+    handled = []
+    results = conda_mirror._validate_packages(
+        repodata,
+        tmpdir.strpath,
+        num_threads=2,
+        executor=executor,
+        on_result=handled.append,
+    )
+    assert sorted(handled) == sorted(results) and len(results) == 4
+    failed = {os.path.basename(path) for path, reason in results if reason}
+    assert failed == {"c-1.0-0.tar.bz2", "d-1.0-0.tar.bz2"}
+    assert sorted(conda_mirror._list_conda_packages(tmpdir.strpath)) == [
+        "a-1.0-0.tar.bz2",
+        "b-1.0-0.tar.bz2",
+    ]
+
+
+def test_validate_packages_ships_package_metadata(tmpdir, monkeypatch):
+    tmpdir.join("a-1.0-0.tar.bz2").write_binary(b"a")
+    tmpdir.join("b-1.0-0.tar.bz2").write_binary(b"b")
+    repodata = {"a-1.0-0.tar.bz2": {"name": "a", "md5": "0" * 32, "size": 1}}
+    tasks = []
+    monkeypatch.setattr(conda_mirror, "_validate_or_remove_package", tasks.append)
+
+    list(conda_mirror._validate_packages(repodata, tmpdir.strpath))
+    assert [task[3] for task in tasks] == [("0" * 32, 1, None), None]
+
+
+@pytest.mark.parametrize("download_workers", [1, 4])
+def test_download_packages(tmpdir, http_server, download_workers):
+    root, base_url = http_server
+    urls = {}
+    for i in range(10):
+        root.join("pkg-%d-0.tar.bz2" % i).write_binary(b"x" * (i + 1))
+        urls["%s/pkg-%d-0.tar.bz2" % (base_url, i)] = {}
+    download_dir = tmpdir.mkdir("download")
+
+    downloaded, verified = conda_mirror._download_packages(
+        urls,
+        download_dir.strpath,
+        tmpdir.strpath,
+        conda_mirror._make_session(download_workers),
+        download_workers=download_workers,
+        show_progress=False,
+    )
+
+    assert downloaded == set(urls)
+    assert verified == []
+    for i in range(10):
+        assert download_dir.join("pkg-%d-0.tar.bz2" % i).size() == i + 1
+
+
+def test_download_packages_verifies_while_streaming(tmpdir, http_server):
+    root, base_url = http_server
+    content = b"conda package contents"
+    root.join("good-1-0.conda").write_binary(content)
+    root.join("bad-1-0.conda").write_binary(content)
+    good_info = {
+        "md5": hashlib.md5(content).hexdigest(),
+        "sha256": hashlib.sha256(content).hexdigest(),
+        "size": len(content),
+    }
+    bad_info = dict(good_info, md5=hashlib.md5(b"other").hexdigest())
+    download_dir = tmpdir.mkdir("download")
+
+    downloaded, verified = conda_mirror._download_packages(
+        {
+            base_url + "/good-1-0.conda": good_info,
+            base_url + "/bad-1-0.conda": bad_info,
+        },
+        download_dir.strpath,
+        tmpdir.strpath,
+        conda_mirror._make_session(),
+        show_progress=False,
+        hash_policy="all",
+    )
+
+    assert len(downloaded) == 2
+    results = {os.path.basename(path): reason for path, reason in verified}
+    assert results["good-1-0.conda"] is None
+    assert "Failed md5 validation" in results["bad-1-0.conda"]
+    assert os.listdir(download_dir.strpath) == ["good-1-0.conda"]
+
+
+def test_download_resumes_interrupted_download(tmpdir, flaky_http_server):
+    root, base_url = flaky_http_server
+    content = os.urandom(100000)
+    root.join("big-1-0.tar.bz2").write_binary(content)
+    hasher = conda_mirror.PackageHasher(
+        {"sha256": hashlib.sha256(content).hexdigest(), "size": len(content)}
+    )
+
+    conda_mirror._download_backoff_retry(
+        base_url + "/big-1-0.tar.bz2",
+        tmpdir.strpath,
+        conda_mirror._make_session(),
+        max_retries=2,
+        show_progress=False,
+        hasher=hasher,
+    )
+
+    first, second = _FlakyRangeHandler.range_headers
+    assert first is None
+    assert 0 < int(second[6:-1]) <= len(content) // 2
+    assert hasher.verify() is None
+    assert tmpdir.join("big-1-0.tar.bz2").read_binary() == content
+
+
+def test_download_packages_async(tmpdir, http_server):
+    pytest.importorskip("aiohttp")
+    import asyncio
+
+    root, base_url = http_server
+    urls = {}
+    for i in range(20):
+        content = b"x" * (i + 1)
+        root.join("pkg-%d-0.conda" % i).write_binary(content)
+        urls["%s/pkg-%d-0.conda" % (base_url, i)] = {
+            "md5": hashlib.md5(content).hexdigest()
+        }
+    download_dir = tmpdir.mkdir("download")
+
+    downloaded, verified = asyncio.run(
+        conda_mirror._download_packages_async(
+            urls,
+            download_dir.strpath,
+            tmpdir.strpath,
+            download_workers=8,
+            connections_per_host=4,
+            show_progress=False,
+        )
+    )
+
+    assert downloaded == set(urls)
+    assert len(verified) == 20
+    assert all(reason is None for _, reason in verified)
+    for i in range(20):
+        assert download_dir.join("pkg-%d-0.conda" % i).size() == i + 1
+
+
+def test_download_packages_aborts_on_error(tmpdir, monkeypatch):
+    def fake_download(url, target_directory, session, **kwargs):
+        if url.endswith("3"):
+            raise RuntimeError("boom")
+        return 1
+
+    monkeypatch.setattr(conda_mirror, "_download_backoff_retry", fake_download)
+    urls = {"https://example.com/%d" % i: {} for i in range(100)}
+    downloaded, _ = conda_mirror._download_packages(
+        urls,
+        tmpdir.strpath,
+        tmpdir.strpath,
+        None,
+        download_workers=4,
+        show_progress=False,
+    )
+
+    assert "https://example.com/3" not in downloaded
+    # nothing is scheduled after the failure except what was already in flight
+    assert len(downloaded) < len(urls) - 1
+
+
+def _make_channel(root, platform, contents, channel="channel", depends=None):
+    """Write a channel with a package for each of `contents` (a mapping of
+    package name to package file contents) into `root`. `depends` maps
+    package names to their dependencies."""
+    subdir = root.ensure_dir(channel, platform)
+    packages = {}
+    for name, content in contents.items():
+        fn = "%s-1.0-0.tar.bz2" % name
+        subdir.join(fn).write_binary(content)
+        packages[fn] = {
+            "name": name,
+            "version": "1.0",
+            "build": "0",
+            "build_number": 0,
+            "depends": (depends or {}).get(name, []),
+            "md5": hashlib.md5(content).hexdigest(),
+            "sha256": hashlib.sha256(content).hexdigest(),
+            "size": len(content),
+            "subdir": platform,
+        }
+    subdir.join("repodata.json").write(
+        json.dumps({"info": {"subdir": platform}, "packages": packages})
+    )
+    return packages
+
+
+@pytest.mark.parametrize("compression", ["bz2", "zst"])
+def test_get_repodata_compressed(tmpdir, http_server, compression):
+    if compression == "zst":
+        zstandard = pytest.importorskip("zstandard")
+        compress = zstandard.ZstdCompressor().compress
+    else:
+        compress = bz2.compress
+    root, base_url = http_server
+    _make_channel(root, "linux-64", {"a": b"package a"})
+    # the compressed variant differs so that we can tell which one was used
+    compressed = {"info": {"subdir": "linux-64"}, "packages": {"b-1.0-0.tar.bz2": {}}}
+    root.join("channel", "linux-64", "repodata.json." + compression).write_binary(
+        compress(json.dumps(compressed).encode())
+    )
+    channel = base_url + "/channel"
+
+    info, packages = conda_mirror.get_repodata(channel, "linux-64")
+    assert list(packages) == ["b-1.0-0.tar.bz2"]
+
+    cache_dir = tmpdir.mkdir("cache").strpath
+    info, packages = conda_mirror.get_repodata(channel, "linux-64", cache_dir=cache_dir)
+    assert list(packages) == ["b-1.0-0.tar.bz2"]
+    cache = conda_mirror.RepodataCache(cache_dir, "channel", "linux-64")
+    assert cache.state["url"].endswith("repodata.json." + compression)
+    assert not cache.fetch(conda_mirror._repodata_url(channel, "linux-64"))
+
+
+class _TrickleReader(io.BytesIO):
+    """Returns at most a few bytes from each read."""
+
+    def read(self, size=-1):
+        return super().read(3)
+
+
+def test_stream_repodata():
+    repodata = {
+        "info": {"subdir": "linux-64"},
+        "packages": {
+            "a-1.0-0.tar.bz2": {
+                "name": "a",
+                "size": 12345,
+                "summary": "caf\u00e9 \u2713",
+            },
+            "b-1.0-0.tar.bz2": {"name": "b", "size": 1.5e3, "depends": ["a"]},
+        },
+        "packages.conda": {},
+        "removed": ["c-1.0-0.tar.bz2"],
+        "repodata_version": 1,
+    }
+    for indent in (None, 2):
+        data = json.dumps(repodata, indent=indent, ensure_ascii=False).encode()
+        streamed = conda_mirror._stream_repodata(
+            _TrickleReader(data), lambda pkg_name, pkg_info: True
+        )
+        assert streamed == repodata
+        streamed = conda_mirror._stream_repodata(
+            _TrickleReader(data), lambda pkg_name, pkg_info: pkg_info["name"] != "b"
+        )
+        assert list(streamed["packages"]) == ["a-1.0-0.tar.bz2"]
+        assert streamed["removed"] == repodata["removed"]
+
+    with pytest.raises(ValueError):
+        conda_mirror._stream_repodata(io.BytesIO(data[:-10]), lambda *args: True)
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_parse_repodata_compacts_records(stream):
+    packages = {
+        "%s-1.0-0.tar.bz2"
+        % name: {
+            "name": name,
+            "license": "BSD-3-" + "Clause",
+            "depends": ["python >=3.8", "numpy"],
+        }
+        for name in ("a", "b")
+    }
+    data = json.dumps({"info": {}, "packages": packages}).encode()
+    keep = (lambda pkg_name, pkg_info: True) if stream else None
+    info, packages = conda_mirror._parse_repodata(io.BytesIO(data), "linux-64", keep)
+    a, b = packages.values()
+    assert a["depends"] == ("python >=3.8", "numpy")
+    assert a["license"] is b["license"]
+    assert a["depends"][0] is b["depends"][0]
+    assert a["subdir"] == "linux-64"
+
+
+def test_compact_records_only_share_common_fields():
+    compact = conda_mirror._CompactRecords()
+    record = compact([("name", "a"), ("md5", "0" * 32), ("fn", "a-1.0-0.tar.bz2")])
+    assert record == {"name": "a", "md5": "0" * 32, "fn": "a-1.0-0.tar.bz2"}
+    # the values unique to a package are not kept in the shared strings
+    assert set(compact._strings) == {"name", "a", "md5", "fn"}
+    # nor are the filenames the records are keyed by
+    packages = compact([("a-1.0-0.tar.bz2", record)])
+    assert packages == {"a-1.0-0.tar.bz2": record}
+    assert "a-1.0-0.tar.bz2" not in compact._strings
+
+
+@pytest.mark.parametrize("no_validate_target", [False, True])
+def test_main_stream_repodata(tmpdir, http_server, no_validate_target):
+    root, base_url = http_server
+    _make_channel(root, "linux-64", {"a": b"package a", "b": b"b", "c": b"c"})
+    results = []
+    for stream_repodata in (False, True):
+        target = tmpdir.mkdir("mirror-%s" % stream_repodata)
+        # blacklisted packages which are already mirrored are only removed
+        # when the target is validated
+        target.ensure_dir("linux-64").join("c-1.0-0.tar.bz2").write_binary(b"c")
+        summary = conda_mirror.main(
+            upstream_channel=base_url + "/channel",
+            target_directory=target.strpath,
+            temp_directory=tmpdir.strpath,
+            platform="linux-64",
+            blacklist=[{"name": "*"}],
+            whitelist=[{"name": "a"}],
+            stream_repodata=stream_repodata,
+            no_validate_target=no_validate_target,
+            show_progress=False,
+        )
+        repodata = json.loads(target.join("linux-64", "repodata.json").read())
+        results.append((summary["blacklisted"], summary["to-mirror"], repodata))
+
+    assert results[0] == results[1]
+    blacklisted, to_mirror, repodata = results[1]
+    assert blacklisted == {"b-1.0-0.tar.bz2", "c-1.0-0.tar.bz2"}
+    assert to_mirror == {"a-1.0-0.tar.bz2"}
+    mirrored = {"a-1.0-0.tar.bz2"}
+    if no_validate_target:
+        mirrored.add("c-1.0-0.tar.bz2")
+    assert set(repodata["packages"]) == mirrored
+
+
+def test_main_validation_cache(tmpdir, http_server):
+    root, base_url = http_server
+    _make_channel(root, "linux-64", {"a": b"package a", "b": b"package b"})
+    kwargs = dict(
+        upstream_channel=base_url + "/channel",
+        target_directory=tmpdir.mkdir("mirror").strpath,
+        temp_directory=tmpdir.mkdir("temp").strpath,
+        platform="linux-64",
+        validation_cache=True,
+        show_progress=False,
+    )
+    local_dir = tmpdir.join("mirror", "linux-64")
+
+    ret = conda_mirror.main(**kwargs)
+    assert len(ret["downloaded"]) == 2
+    # the cache is not published with the mirror
+    filename = conda_mirror.VALIDATION_CACHE_FILENAME
+    assert not local_dir.join(filename).check()
+    cache_dir = tmpdir.join("temp", "validation-cache", "channel", "linux-64")
+    assert cache_dir.join(filename).check()
+
+    # validated packages are trusted as long as they do not change
+    ret = conda_mirror.main(**kwargs)
+    assert ret["validating-existing"] == set()
+    local_dir.join("b-1.0-0.tar.bz2").write_binary(b"corrupt b")
+    ret = conda_mirror.main(**kwargs)
+    ((path, reason),) = ret["validating-existing"]
+    assert path.endswith("b-1.0-0.tar.bz2") and "Failed sha256" in reason
+    assert local_dir.join("b-1.0-0.tar.bz2").read_binary() == b"package b"
+
+    ret = conda_mirror.main(validation_cache_max_age=0, **kwargs)
+    assert len(ret["validating-existing"]) == 2
+
+    # the cache can be kept elsewhere
+    cache_dir = tmpdir.join("validation")
+    ret = conda_mirror.main(validation_cache_dir=cache_dir.strpath, **kwargs)
+    assert len(ret["validating-existing"]) == 2
+    assert cache_dir.join("channel", "linux-64", filename).check()
+    ret = conda_mirror.main(validation_cache_dir=cache_dir.strpath, **kwargs)
+    assert ret["validating-existing"] == set()
+
+
+def test_main_validation_cache_keeps_interrupted_work(tmpdir, http_server, monkeypatch):
+    root, base_url = http_server
+    _make_channel(root, "linux-64", {"a": b"package a", "b": b"package b"})
+    kwargs = dict(
+        upstream_channel=base_url + "/channel",
+        target_directory=tmpdir.mkdir("mirror").strpath,
+        temp_directory=tmpdir.mkdir("temp").strpath,
+        platform="linux-64",
+        show_progress=False,
+    )
+    conda_mirror.main(**kwargs)
+
+    validate = conda_mirror._validate_or_remove_package
+
+    def interrupted(args):
+        if args[1] == 1:
+            raise RuntimeError("interrupted")
+        return validate(args)
+
+    monkeypatch.setattr(conda_mirror, "VALIDATION_CACHE_BATCH_SIZE", 1)
+    monkeypatch.setattr(conda_mirror, "_validate_or_remove_package", interrupted)
+    with pytest.raises(RuntimeError):
+        conda_mirror.main(validation_cache=True, **kwargs)
+    monkeypatch.undo()
+
+    # the package validated before the interruption is not validated again
+    ret = conda_mirror.main(validation_cache=True, **kwargs)
+    ((path, reason),) = ret["validating-existing"]
+    assert path.endswith("b-1.0-0.tar.bz2") and reason is None
+
+
+def test_main_validation_cache_hash_policy(tmpdir, http_server):
+    root, base_url = http_server
+    _make_channel(root, "linux-64", {"a": b"package a", "b": b"package b"})
+    kwargs = dict(
+        upstream_channel=base_url + "/channel",
+        target_directory=tmpdir.mkdir("mirror").strpath,
+        temp_directory=tmpdir.mkdir("temp").strpath,
+        platform="linux-64",
+        validation_cache=True,
+        show_progress=False,
+    )
+
+    ret = conda_mirror.main(hash_policy="md5", **kwargs)
+    assert len(ret["downloaded"]) == 2
+    ret = conda_mirror.main(hash_policy="md5", **kwargs)
+    assert ret["validating-existing"] == set()
+    # packages only verified by md5 are validated again under a stricter policy
+    ret = conda_mirror.main(hash_policy="all", **kwargs)
+    assert len(ret["validating-existing"]) == 2
+    ret = conda_mirror.main(hash_policy="all", **kwargs)
+    assert ret["validating-existing"] == set()
+    # but are still trusted under a weaker one
+    ret = conda_mirror.main(hash_policy="sha256", **kwargs)
+    assert ret["validating-existing"] == set()
+
+
+@pytest.mark.parametrize(
+    "platform, download_backend",
+    [
+        ("linux-64,osx-64", "requests"),
+        (["linux-64", "osx-64"], "requests"),
+        (["linux-64", "osx-64"], "asyncio"),
+    ],
+)
+def test_main_multiple_platforms(tmpdir, http_server, platform, download_backend):
+    if download_backend == "asyncio":
+        pytest.importorskip("aiohttp")
+    root, base_url = http_server
+    _make_channel(root, "linux-64", {"a": b"package a", "b": b"package b"})
+    _make_channel(root, "osx-64", {"a": b"osx package a", "c": b"package c"})
+    target = tmpdir.mkdir("mirror")
+    # a corrupt package must only be removed from its own platform
+    target.ensure_dir("osx-64").join("b-1.0-0.tar.bz2").write_binary(b"b")
+
+    summary = conda_mirror.main(
+        upstream_channel=base_url + "/channel",
+        target_directory=target.strpath,
+        temp_directory=tmpdir.strpath,
+        platform=platform,
+        num_threads=2,
+        validation_executor="thread",
+        download_workers=2,
+        download_backend=download_backend,
+        show_progress=False,
+    )
+
+    assert len(summary["downloaded"]) == 4
+    assert summary["to-mirror"] == {
+        "a-1.0-0.tar.bz2",
+        "b-1.0-0.tar.bz2",
+        "c-1.0-0.tar.bz2",
+    }
+    ((path, reason),) = summary["validating-existing"]
+    assert path == target.join("osx-64", "b-1.0-0.tar.bz2").strpath
+    for subdir, packages in [
+        ("linux-64", {"a-1.0-0.tar.bz2", "b-1.0-0.tar.bz2"}),
+        ("osx-64", {"a-1.0-0.tar.bz2", "c-1.0-0.tar.bz2"}),
+    ]:
+        repodata = json.loads(target.join(subdir, "repodata.json").read())
+        assert set(repodata["packages"]) == packages
+        assert set(conda_mirror._list_conda_packages(target.join(subdir))) == packages
+    assert target.join("osx-64", "a-1.0-0.tar.bz2").read_binary() == b"osx package a"
+    assert target.join("noarch", "repodata.json").check()
+
+
+def test_restore_required_dependencies_offline():
+    def pkg(name, version, depends=(), build="0"):
+        return {"name": name, "version": version, "build": build, "depends": depends}
+
+    all_packages = {
+        "app-1.0-0.tar.bz2": pkg("app", "1.0", ["lib >=2", "python"]),
+        "app-2.0-0.tar.bz2": pkg("app", "2.0", ["lib >=2"]),
+        "lib-1.0-0.tar.bz2": pkg("lib", "1.0", ["base"]),
+        "lib-2.0-0.tar.bz2": pkg("lib", "2.0", ["base 1.*"]),
+        "lib-3.0-0.tar.bz2": pkg("lib", "3.0", ["app"]),
+        "base-1.0-0.tar.bz2": pkg("base", "1.0"),
+        "base-1.1-1.tar.bz2": pkg("base", "1.1", build="1"),
+        "base-2.0-1.tar.bz2": pkg("base", "2.0", build="1"),
+        "python-3.9-0.tar.bz2": pkg("python", "3.9"),
+    }
+    required = {"app-1.0-0.tar.bz2"}
+    excluded = set(all_packages) - required
+    final = conda_mirror._restore_required_dependencies(
+        all_packages, excluded, required
+    )
+    # other versions of required packages are not restored, even if another
+    # required package depends on them
+    assert final == {"app-2.0-0.tar.bz2", "lib-1.0-0.tar.bz2", "base-2.0-1.tar.bz2"}
+
+
+def test_restore_required_dependencies_across_subdirs():
+    def pkg(name, version="1.0", depends=()):
+        return {"name": name, "version": version, "build": "0", "depends": depends}
+
+    subdir_packages = {
+        "linux-64": {
+            "app-1.0-0.tar.bz2": pkg("app", depends=["lib >=2"]),
+            "base-1.0-0.tar.bz2": pkg("base"),
+            "other-1.0-0.tar.bz2": pkg("other"),
+        },
+        "osx-64": {
+            "base-1.0-0.tar.bz2": pkg("base"),
+            "other-1.0-0.tar.bz2": pkg("other"),
+        },
+        "noarch": {
+            "lib-1.0-0.tar.bz2": pkg("lib", depends=["base"]),
+            "lib-2.0-0.tar.bz2": pkg("lib", "2.0", depends=["base"]),
+            "tool-1.0-0.tar.bz2": pkg("tool", depends=["other"]),
+        },
+    }
+    excluded = {
+        subdir: set(packages) - {"app-1.0-0.tar.bz2"}
+        for subdir, packages in subdir_packages.items()
+    }
+    required = {subdir: set() for subdir in subdir_packages}
+    required["linux-64"].add("app-1.0-0.tar.bz2")
+
+    final = conda_mirror._restore_required_dependencies_across_subdirs(
+        subdir_packages, excluded, required
+    )
+    assert final == {
+        "linux-64": {"other-1.0-0.tar.bz2"},
+        # nothing on osx-64 depends on lib
+        "osx-64": {"base-1.0-0.tar.bz2", "other-1.0-0.tar.bz2"},
+        "noarch": {"lib-1.0-0.tar.bz2", "tool-1.0-0.tar.bz2"},
+    }
+
+    # the dependencies of whitelisted noarch packages apply to every platform
+    required = {subdir: set() for subdir in subdir_packages}
+    required["noarch"].add("tool-1.0-0.tar.bz2")
+    excluded["noarch"].discard("tool-1.0-0.tar.bz2")
+    final = conda_mirror._restore_required_dependencies_across_subdirs(
+        subdir_packages, excluded, required
+    )
+    assert final["linux-64"] == final["osx-64"] == {"base-1.0-0.tar.bz2"}
+    assert final["noarch"] == {"lib-1.0-0.tar.bz2", "lib-2.0-0.tar.bz2"}
+
+
+def test_main_include_depends_noarch(tmpdir, http_server):
+    root, base_url = http_server
+    _make_channel(
+        root,
+        "linux-64",
+        {"app": b"app", "base": b"base", "other": b"other"},
+        depends={"app": ["lib"]},
+    )
+    _make_channel(
+        root, "noarch", {"lib": b"lib", "tool": b"tool"}, depends={"lib": ["base"]}
+    )
+    target = tmpdir.mkdir("mirror")
+    summary = conda_mirror.main(
+        upstream_channel=base_url + "/channel",
+        target_directory=target.strpath,
+        temp_directory=tmpdir.strpath,
+        platform="linux-64,noarch",
+        blacklist=[{"name": "*"}],
+        whitelist=[{"name": "app"}],
+        include_depends=True,
+        show_progress=False,
+    )
+    assert summary["to-mirror"] == {
+        "app-1.0-0.tar.bz2",
+        "base-1.0-0.tar.bz2",
+        "lib-1.0-0.tar.bz2",
+    }
+    for subdir, packages in [
+        ("linux-64", {"app-1.0-0.tar.bz2", "base-1.0-0.tar.bz2"}),
+        ("noarch", {"lib-1.0-0.tar.bz2"}),
+    ]:
+        repodata = json.loads(target.join(subdir, "repodata.json").read())
+        assert set(repodata["packages"]) == packages
+
+
+def test_mirror_channels_from_config(tmpdir, http_server, monkeypatch):
+    root, base_url = http_server
+    _make_channel(root, "linux-64", {"a": b"package a", "b": b"package b"}, "one")
+    _make_channel(root, "noarch", {"c": b"package c"}, "one")
+    _make_channel(root, "linux-64", {"a": b"two a", "d": b"package d"}, "two")
+    config = {
+        "platform": "linux-64,noarch",
+        "blacklist": [{"name": "b"}],
+        "channels": [
+            base_url + "/one",
+            {
+                "upstream_channel": base_url + "/two",
+                "platform": "linux-64",
+                "blacklist": [{"name": "a"}],
+                "target_directory": "other",
+            },
+        ],
+    }
+    config_path = tmpdir.join("config.yaml")
+    config_path.write(yaml.safe_dump(config))
+    target = tmpdir.mkdir("mirror")
+    monkeypatch.setattr(
+        sys,
+        "argv",
+        [
+            "conda-mirror",
+            "--config",
+            config_path.strpath,
+            "--target-directory",
+            target.strpath,
+            "--temp-directory",
+            tmpdir.strpath,
+            "--download-workers",
+            "2",
+            "--max-bandwidth",
+            "100",
+            "--minimum-free-space",
+            "0",
+            "--no-progress",
+        ],
+    )
+    conda_mirror.cli()
+
+    for subdir, packages in [
+        (target.join("one", "linux-64"), {"a-1.0-0.tar.bz2"}),
+        (target.join("one", "noarch"), {"c-1.0-0.tar.bz2"}),
+        (target.join("other", "linux-64"), {"d-1.0-0.tar.bz2"}),
+    ]:
+        repodata = json.loads(subdir.join("repodata.json").read())
+        assert set(repodata["packages"]) == packages
+        assert set(conda_mirror._list_conda_packages(subdir.strpath)) == packages
+    assert not target.join("two").check()
+
+
+def test_watch(tmpdir, http_server, monkeypatch, caplog):
+    conda_mirror._init_logger(2)
+    root, base_url = http_server
+    _make_channel(root, "linux-64", {"a": b"package a"})
+    repodata = root.join("channel", "linux-64", "repodata.json")
+
+    def add_package():
+        mtime = repodata.mtime()
+        _make_channel(root, "linux-64", {"a": b"package a", "b": b"package b"})
+        # the server only tells modifications apart by the second
+        repodata.setmtime(mtime + 10)
+
+    # what changes upstream after each cycle
+    changes = [
+        # the repodata disappears, which fails the next cycle
+        lambda: repodata.move(root.join("repodata.json")),
+        lambda: root.join("repodata.json").move(repodata),
+        add_package,
+    ]
+    sleeps = []
+
+    def _sleep(seconds):
+        sleeps.append(seconds)
+        if changes:
+            changes.pop(0)()
+
+    monkeypatch.setattr(conda_mirror.time, "sleep", _sleep)
+    target = tmpdir.mkdir("mirror")
+    conda_mirror.watch(
+        60,
+        target.strpath,
+        tmpdir.mkdir("temp").strpath,
+        upstream_channel=base_url + "/channel",
+        platform="linux-64",
+        max_cycles=5,
+        minimum_free_space=0,
+        show_progress=False,
+    )
+
+    assert len(sleeps) == 4 and all(0 < s <= 60 for s in sleeps)
+    assert set(conda_mirror._list_conda_packages(target.join("linux-64").strpath)) == {
+        "a-1.0-0.tar.bz2",
+        "b-1.0-0.tar.bz2",
+    }
+    messages = [r.getMessage() for r in caplog.records]
+    assert "Mirror cycle 1 downloaded 1 packages" in "\n".join(messages)
+    assert "Mirror cycle 2 failed" in messages
+    # the repodata did not change since the first cycle
+    assert "Mirror cycle 3 downloaded 0 packages" in "\n".join(messages)
+    assert "Mirror cycle 4 downloaded 1 packages" in "\n".join(messages)
+    assert sum("Nothing to do" in m for m in messages) == 2
+
+
+def test_watch_retries_failed_packages(tmpdir, http_server, monkeypatch, caplog):
+    conda_mirror._init_logger(2)
+    root, base_url = http_server
+    _make_channel(root, "linux-64", {"a": b"package a"})
+    package_a = root.join("channel", "linux-64", "a-1.0-0.tar.bz2")
+    package_a.write_binary(b"corrupted package a")
+    local_directory = tmpdir.join("mirror", "linux-64").strpath
+    found = []
+
+    def _sleep(seconds):
+        # fix the package upstream without changing the repodata
+        found.append(conda_mirror._list_conda_packages(local_directory))
+        package_a.write_binary(b"package a")
+
+    monkeypatch.setattr(conda_mirror.time, "sleep", _sleep)
+    conda_mirror.watch(
+        60,
+        tmpdir.join("mirror").strpath,
+        tmpdir.mkdir("temp").strpath,
+        upstream_channel=base_url + "/channel",
+        platform="linux-64",
+        max_cycles=2,
+        minimum_free_space=0,
+        show_progress=False,
+    )
+
+    assert found == [[]]
+    assert "Mirror cycle 1 downloaded 1 packages (1 failed verification)" in (
+        caplog.text
+    )
+    assert conda_mirror._list_conda_packages(local_directory) == ["a-1.0-0.tar.bz2"]
+
+
+def test_mirror_channels_rejects_clashing_targets(tmpdir):
+    with pytest.raises(ValueError, match="Several channels"):
+        conda_mirror.mirror_channels(
+            [
+                "conda-forge",
+                {"upstream_channel": "bioconda", "target_directory": "conda-forge"},
+            ],
+            tmpdir.strpath,
+            tmpdir.strpath,
+            platform="linux-64",
+        )
+    with pytest.raises(ValueError, match="Unknown options"):
+        conda_mirror.mirror_channels(
+            [{"upstream_channel": "conda-forge", "latest": 1}],
+            tmpdir.strpath,
+            tmpdir.strpath,
+            platform="linux-64",
+        )
+
+
+def test_bandwidth_limiter():
+    limiter = conda_mirror._BandwidthLimiter(1000, burst=0.5)
+    # up to `burst` seconds worth of data are let through without delay
+    assert limiter.reserve(500) == pytest.approx(0, abs=0.05)
+    assert limiter.reserve(1000) == pytest.approx(1, abs=0.05)
+    assert limiter.reserve(500) == pytest.approx(1.5, abs=0.05)
+
+
+def _jlap(patches, latest):
+    """The contents of a repodata.jlap file with `patches`."""
+    iv = bytes(32)
+    lines = [json.dumps(patch).encode() for patch in patches]
+    lines.append(json.dumps({"url": "repodata.json", "latest": latest}).encode())
+    digest = iv
+    for line in lines:
+        digest = hashlib.blake2b(line, key=digest, digest_size=32).digest()
+    return b"\n".join([iv.hex().encode()] + lines + [digest.hex().encode()]) + b"\n"
+
+
+def test_repodata_cache_jlap(tmpdir, range_http_server):
+    root, base_url = range_http_server
+    _make_channel(root, "linux-64", {"a": b"package a"})
+    subdir = root.join("channel", "linux-64")
+    url = base_url + "/channel/linux-64/repodata.json"
+    cache = conda_mirror.RepodataCache(tmpdir.strpath, "channel", "linux-64")
+
+    # the first fetch downloads the full repodata
+    assert cache.fetch(url, use_jlap=True)
+    repodata = cache.load()
+    blake2b = hashlib.blake2b(
+        subdir.join("repodata.json").read_binary(), digest_size=32
+    )
+    assert cache.state["have"] == blake2b.hexdigest()
+
+    # then the repodata is only patched, note that upstream repodata.json is
+    # never updated in this test
+    patches = [
+        {
+            "from": cache.state["have"],
+            "to": "1" * 64,
+            "patch": [{"op": "add", "path": "/info/version", "value": 1}],
+        }
+    ]
+    subdir.join("repodata.jlap").write_binary(_jlap(patches, "1" * 64))
+    assert cache.fetch(url, use_jlap=True)
+    repodata["info"]["version"] = 1
+    assert cache.load() == repodata
+    assert _RangeHandler.range_headers[-1] is None
+
+    # only the tail of repodata.jlap is requested
+    patches.append(
+        {
+            "from": "1" * 64,
+            "to": "2" * 64,
+            "patch": [
+                {"op": "replace", "path": "/info/version", "value": 2},
+                {"op": "remove", "path": "/packages/a-1.0-0.tar.bz2"},
+            ],
+        }
+    )
+    subdir.join("repodata.jlap").write_binary(_jlap(patches, "2" * 64))
+    assert cache.fetch(url, use_jlap=True)
+    repodata["info"]["version"] = 2
+    del repodata["packages"]["a-1.0-0.tar.bz2"]
+    assert cache.load() == repodata
+    pos = cache.state["jlap"]["pos"]
+    assert _RangeHandler.range_headers[-1].startswith("bytes=")
+    assert not cache.fetch(url, use_jlap=True)
+    assert _RangeHandler.range_headers[-1] == "bytes=%d-" % pos
+
+    # without a chain of patches from the cached version the full repodata is
+    # downloaded again
+    subdir.join("repodata.jlap").write_binary(_jlap(patches[1:], "2" * 64))
+    assert cache.fetch(url, use_jlap=True)
+    assert cache.load()["info"] == {"subdir": "linux-64"}
+    assert cache.state["have"] == blake2b.hexdigest()
+
+
+def test_apply_json_patch():
+    doc = {"a": {"b": ["c", "d"]}, "e~/f": 1}
+    patch = [
+        {"op": "add", "path": "/a/b/1", "value": "x"},
+        {"op": "add", "path": "/a/b/-", "value": "y"},
+        {"op": "remove", "path": "/a/b/0"},
+        {"op": "replace", "path": "/e~0~1f", "value": 2},
+        {"op": "copy", "from": "/a/b", "path": "/g"},
+        {"op": "move", "from": "/a", "path": "/h"},
+        {"op": "test", "path": "/g/2", "value": "y"},
+    ]
+    assert conda_mirror._apply_json_patch(doc, patch) == {
+        "e~/f": 2,
+        "g": ["x", "d", "y"],
+        "h": {"b": ["x", "d", "y"]},
+    }
+    with pytest.raises(ValueError):
+        conda_mirror._apply_json_patch(
+            doc, [{"op": "test", "path": "/e~0~1f", "value": 1}]
+        )
+    with pytest.raises(KeyError):
+        conda_mirror._apply_json_patch(
+            doc, [{"op": "replace", "path": "/z", "value": 1}]
+        )
+
+
+def test_main_repodata_cache(tmpdir, http_server):
+    root, base_url = http_server
+    _make_channel(root, "linux-64", {"a": b"package a", "b": b"package b"})
+    kwargs = dict(
+        upstream_channel=base_url + "/channel",
+        target_directory=tmpdir.mkdir("mirror").strpath,
+        temp_directory=tmpdir.mkdir("temp").strpath,
+        platform="linux-64",
+        repodata_cache_dir=tmpdir.mkdir("cache").strpath,
+        show_progress=False,
+    )
+
+    ret = conda_mirror.main(**kwargs)
+    assert len(ret["downloaded"]) == 2
+    assert tmpdir.join("cache", "channel", "linux-64", "repodata.json").check()
+
+    # nothing changed upstream, so the run is skipped
+    ret = conda_mirror.main(**kwargs)
+    assert ret["to-mirror"] == set()
+    assert ret["validating-existing"] == set()
+
+    # a changed configuration is applied even if upstream did not change
+    ret = conda_mirror.main(blacklist=[{"name": "b"}], **kwargs)
+    assert ret["blacklisted"] == {"b-1.0-0.tar.bz2"}
+    assert len(ret["validating-existing"]) == 2
+
+
+def test_main_repodata_cache_retries_failed_packages(tmpdir, http_server):
+    root, base_url = http_server
+    _make_channel(root, "linux-64", {"a": b"package a", "b": b"package b"})
+    package_b = root.join("channel", "linux-64", "b-1.0-0.tar.bz2")
+    package_b.write_binary(b"corrupted package b")
+    kwargs = dict(
+        upstream_channel=base_url + "/channel",
+        target_directory=tmpdir.mkdir("mirror").strpath,
+        temp_directory=tmpdir.mkdir("temp").strpath,
+        platform="linux-64",
+        repodata_cache_dir=tmpdir.mkdir("cache").strpath,
+        show_progress=False,
+    )
+    local_directory = tmpdir.join("mirror", "linux-64").strpath
+
+    ret = conda_mirror.main(**kwargs)
+    assert any(reason is not None for _, reason in ret["validating-new"])
+    assert conda_mirror._list_conda_packages(local_directory) == ["a-1.0-0.tar.bz2"]
+
+    # the upstream repodata is unchanged, but the run was not complete
+    package_b.write_binary(b"package b")
+    ret = conda_mirror.main(**kwargs)
+    assert ret["to-mirror"] == {"b-1.0-0.tar.bz2"}
+    assert sorted(conda_mirror._list_conda_packages(local_directory)) == [
+        "a-1.0-0.tar.bz2",
+        "b-1.0-0.tar.bz2",
+    ]
+
+    # now it is complete and the next run is skipped
+    ret = conda_mirror.main(**kwargs)
+    assert ret["to-mirror"] == set()
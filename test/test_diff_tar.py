@@ -31,6 +31,16 @@ def test_md5_file(tmpdir):
     assert dt.md5_file(tmpfile) == "bf072e9119077b4e76437a93986787ef"
 
 
+def test_hash_file(tmpdir):
+    tmpfile = join(tmpdir, "testfile")
+    with open(tmpfile, "wb") as fo:
+        fo.write(b"A\n")
+    assert dt.hash_file(tmpfile, ["md5", "sha256"]) == {
+        "md5": "bf072e9119077b4e76437a93986787ef",
+        "sha256": "06f961b802bc46ee168555f066d28f4f0e9afdf3f88174c1ee6f9de004fc30a0",
+    }
+
+
 def create_test_repo(subdirname="linux-64"):
     subdir = join(dt.mirror_dir, subdirname)
     os.makedirs(subdir)
@@ -52,9 +62,17 @@ def test_all_repodata_repos(tmpdir):
     assert d[join(dt.mirror_dir, "linux-64")]["a-1.0-0.tar.bz2"]["md5"] == EMPTY_MD5
 
 
-def test_verify_all_repos(tmpdir):
+def test_verify_all_repos(tmpdir, capsys):
     create_test_repo()
     dt.verify_all_repos(dt.mirror_dir)
+    assert capsys.readouterr().out == ""
+
+    # sha256 sums are preferred over md5 sums
+    with open(join(dt.mirror_dir, "linux-64", "repodata.json"), "w") as fo:
+        info = {"md5": EMPTY_MD5, "sha256": "0" * 64}
+        fo.write(json.dumps({"packages": {"a-1.0-0.tar.bz2": info}}))
+    dt.verify_all_repos(dt.mirror_dir)
+    assert capsys.readouterr().out.startswith("SHA256 mismatch: ")
 
 
 def test_read_no_reference(tmpdir):
@@ -0,0 +1,162 @@
+import itertools
+import random
+
+import pytest
+
+from conda_mirror import versionspec
+from conda_mirror.versionspec import LRUCache, VersionOrder, VersionSpec
+
+# the order from the docstring of VersionOrder
+ORDERED_VERSIONS = [
+    "0.4",
+    "0.4.0",
+    "0.4.1.rc",
+    "0.4.1.RC",
+    "0.4.1",
+    "0.5a1",
+    "0.5b3",
+    "0.5C1",
+    "0.5",
+    "0.9.6",
+    "0.960923",
+    "1.0",
+    "1.1dev1",
+    "1.1_",
+    "1.1a1",
+    "1.1.0dev1",
+    "1.1.dev1",
+    "1.1.a1",
+    "1.1.0rc1",
+    "1.1.0",
+    "1.1",
+    "1.1.0post1",
+    "1.1.post1",
+    "1.1post1",
+    "1996.07.12",
+    "1!0.4.1",
+    "1!3.1.1.6",
+    "2!0.4.1",
+]
+
+
+def _random_versions(num, seed=0):
+    rng = random.Random(seed)
+    atoms = ["0", "1", "2", "10", "a", "rc", "dev", "post", "_", "0a", "1b2", "dev1"]
+    versions = set()
+    while len(versions) < num:
+        version = ".".join(
+            [rng.choice("012")] + [rng.choice(atoms) for _ in range(rng.randint(0, 4))]
+        )
+        if rng.random() < 0.2:
+            version += "+" + ".".join(rng.choice(atoms) for _ in range(2))
+        if rng.random() < 0.1:
+            version = "1!" + version
+        try:
+            VersionOrder(version)
+        except ValueError:
+            continue
+        versions.add(version)
+    return sorted(versions)
+
+
+@pytest.mark.parametrize(
+    "versions", [ORDERED_VERSIONS, _random_versions(300)], ids=["docs", "random"]
+)
+def test_sort_key_agrees_with_comparisons(versions):
+    for a, b in itertools.product(map(VersionOrder, versions), repeat=2):
+        assert (a < b) == (a.sort_key < b.sort_key), (a, b)
+        assert (a == b) == (a.sort_key == b.sort_key), (a, b)
+
+
+def test_sort_key_orders_versions():
+    versions = list(reversed(ORDERED_VERSIONS))
+    assert sorted(versions, key=lambda v: VersionOrder(v).sort_key) == sorted(
+        versions, key=VersionOrder
+    )
+
+
+def test_sort_keys():
+    versions = ["1.10", "1.9", "1.9.0", "1.10", "2.0rc1"]
+    keys = VersionOrder.sort_keys(versions)
+    assert keys == [VersionOrder(v).sort_key for v in versions]
+    assert keys[0] is keys[3]
+    assert keys[1] == keys[2]
+    with pytest.raises(ValueError):
+        VersionOrder.sort_keys(["1.0", "1..0"])
+
+
+def test_lru_cache():
+    cache = LRUCache(maxsize=2)
+    cache["a"] = 1
+    cache["b"] = 2
+    assert cache["a"] == 1
+    # "b" is the least recently used entry
+    cache["c"] = 3
+    assert "b" not in cache and "a" in cache and "c" in cache
+    with pytest.raises(KeyError):
+        cache["b"]
+    assert cache.stats() == {
+        "size": 2,
+        "maxsize": 2,
+        "hits": 1,
+        "misses": 1,
+        "evictions": 1,
+    }
+    cache.resize(1)
+    assert len(cache) == 1 and "c" in cache
+    cache.resize(None)
+    for i in range(100):
+        cache[i] = i
+    assert len(cache) == 101
+
+
+def test_bounded_caches():
+    stats = versionspec.cache_stats()
+    assert set(stats) == {"VersionOrder", "VersionSpec", "BuildNumberMatch"}
+    try:
+        versionspec.set_cache_size(10)
+        specs = [VersionSpec(">=1.%d" % i) for i in range(20)]
+        assert len(VersionSpec._cache_) == 10
+        assert len(VersionOrder._cache_) == 10
+        # recently used specs are still cached
+        assert VersionSpec(">=1.19") is specs[-1]
+        assert VersionSpec(">=1.0") is not specs[0]
+        assert versionspec.cache_stats()["VersionSpec"]["evictions"] > 0
+    finally:
+        versionspec.set_cache_size(versionspec.DEFAULT_CACHE_SIZE)
+
+
+@pytest.mark.parametrize(
+    "spec",
+    [
+        "*",
+        "1.1",
+        "==1.1.0",
+        "!=1.1",
+        ">=0.5,<1.1",
+        ">0.4.1,<=1!0.4.1,!=0.9.6",
+        ">=1.1,<1.0",
+        "0.4.*",
+        "=1.1",
+        "!=0.4.*",
+        "~=0.4.1",
+        "1.*.0",
+        ">=1996|<0.5",
+        "^0\\.4.*$|^1\\.1.*$",
+        "(>=0.5,<1|1.1.*),!=0.9.6",
+        "0.5a1|1.1_|>2!0",
+    ],
+)
+def test_predicate_agrees_with_match(spec):
+    vspec = VersionSpec(spec)
+    for version in ORDERED_VERSIONS + _random_versions(100):
+        assert vspec.predicate(version) == vspec.match(version), version
+    assert vspec.predicate is vspec.predicate
+
+
+def test_predicate_invalid_versions():
+    # a regex matches before the version is parsed
+    assert VersionSpec("^1.*$|>=2").predicate("1..0")
+    with pytest.raises(ValueError):
+        VersionSpec(">=2|^1.*$").predicate("1..0")
+    assert VersionSpec("*").predicate("1..0")